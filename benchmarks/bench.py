@@ -0,0 +1,270 @@
+'''Benchmarks of the viewer and generator hot paths, run outside Sublime Text.
+
+    python benchmarks/bench.py [-o results.json] [--compare previous.json]
+
+The plugin is imported with the stub `sublime` and `sublime_plugin` modules
+of benchmarks/stubs, from a temporary Packages directory where this
+repository is linked as `LaTeXSymbols`, and runs on the bundled database
+and icons. Refreshes need PyYAML, and run the real rendering pipeline with
+the fake `latex` and `dvipng` executables of benchmarks/fake_tex put first
+on the PATH (POSIX only): they write fixture DVI files and PNGs instead of
+typesetting, so that the process runs, format cache, batching and resizing
+are timed without TeX. Results are written as JSON, so that two versions
+can be compared with --compare.
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import statistics
+import contextlib
+
+
+# ------------------------------- Configuration -----------------------------
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PKG_NAME = "LaTeXSymbols"
+QUERIES = ["a", "ar", "arr", "arrow", "alpha", "leq", "sum", "math", "amssymb",
+           "\\sum", "xyz"]
+TYPED = "arrow"
+FAKE_TEX_DIR = os.path.join(ROOT, "benchmarks", "fake_tex")
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def measure(fn, repeat, setup=None):
+    '''(timings, result of the last run) of `repeat` runs of `fn`'''
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "min_ms": round(min(times) * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "runs": repeat,
+    }, result
+
+# ------------
+
+def setup_packages(tmpdir):
+    '''A Packages directory containing this repository as LaTeXSymbols'''
+    packages = os.path.join(tmpdir, "Packages")
+    os.makedirs(os.path.join(packages, "User"))
+    link = os.path.join(packages, PKG_NAME)
+    try:
+        os.symlink(ROOT, link, target_is_directory=True)
+    except OSError:
+        shutil.copytree(ROOT, link, ignore=shutil.ignore_patterns(".git", "__pycache__"))
+    return packages
+
+# ------------
+
+def import_plugin(packages):
+    sys.path.insert(0, os.path.join(ROOT, "benchmarks", "stubs"))
+    import sublime
+    sublime.PACKAGES_PATH = packages
+    sys.path.insert(0, packages)
+    return sublime, importlib.import_module(f"{PKG_NAME}.symbols_viewer")
+
+
+class FakeView:
+    def visible_region(self):
+        import sublime
+        return sublime.Region(0, 0)
+
+    def rowcol(self, point):
+        return (0, 0)
+
+    def text_point(self, row, col):
+        return 0
+
+    def show_popup(self, html, **kwargs):
+        pass
+
+    def is_popup_visible(self):
+        return False
+
+
+# -------------------------------- Viewer -------------------------------------
+
+def bench_viewer(sublime, viewer, repeat):
+    store = importlib.import_module(f"{PKG_NAME}.utils.symbol_store")
+    pack = importlib.import_module(f"{PKG_NAME}.utils.symbol_pack")
+    views_module = importlib.import_module(f"{PKG_NAME}.utils.symbol_views")
+    search_index = importlib.import_module(f"{PKG_NAME}.utils.search_index")
+    icon_cache = importlib.import_module(f"{PKG_NAME}.utils.icon_cache").icon_cache
+    settings = sublime.load_settings('LaTeXSymbols.sublime-settings')
+    data_dir = os.path.join(sublime.packages_path(), PKG_NAME)
+    results = {}
+
+    results["load_symbols/pack"], _ = measure(
+        lambda: pack.read_symbol_pack(os.path.join(data_dir, store.PACK_FILE)), repeat)
+    results["load_symbols/json"], _ = measure(
+        lambda: store.read_json(os.path.join(data_dir, store.METADATA_FILE)), repeat)
+    results["load_symbols"], symbols = measure(
+        lambda: store.symbol_store.reload(), repeat)
+    results["load_symbols"]["symbols"] = len(symbols)
+    results["build_views"], _ = measure(lambda: views_module.SymbolViews(symbols), repeat)
+    results["build_index"], _ = measure(lambda: search_index.SearchIndex(symbols), repeat)
+    views = store.symbol_store.views()
+    views.index()
+
+    for mode in ("fuzzy", "substring"):
+        settings.values["search_mode"] = mode
+        for query in QUERIES:
+            stats, found = measure(
+                lambda: viewer.SymbolSearchSession(FakeView()).filter_symbols(query),
+                repeat)
+            stats["results"] = len(found)
+            results[f"filter/{mode}/{query}"] = stats
+
+        # Typing one character at a time narrows the previous results
+        def typing():
+            session = viewer.SymbolSearchSession(FakeView())
+            for i in range(1, len(TYPED) + 1):
+                session.filter_symbols(TYPED[:i])
+        results[f"filter/{mode}/typing {TYPED}"], _ = measure(typing, repeat)
+    settings.values.pop("search_mode", None)
+
+    ranks = views.ranks(range(len(symbols)))
+    results["grouped_symbols"], _ = measure(lambda: views.grouped(ranks), repeat)
+
+    # First page of the unfiltered popup, without then with warm caches
+    page_size = settings.get("page_size", 0) or len(ranks)
+    page_count = (len(ranks) + page_size - 1) // page_size
+    grouped = views.grouped(ranks[:page_size])
+
+    def cold():
+        viewer.fragments.clear()
+        icon_cache.invalidate()
+
+    def render():
+        return viewer.generate_html(grouped, special_search="search", key="",
+                                    page=(0, page_count) if page_count > 1 else None)
+
+    results["generate_html/cold"], html = measure(render, repeat, setup=cold)
+    results["generate_html/cold"]["bytes"] = len(html.encode("utf-8"))
+    results["generate_html/warm"], _ = measure(render, repeat)
+
+    for query in ("", "arrow"):
+        stats, html = measure(
+            lambda: viewer.SymbolSearchSession(FakeView()).build(query)[1], repeat)
+        stats["bytes"] = len(html.encode("utf-8"))
+        results[f"update_popup/{query or 'all'}"] = stats
+    return results
+
+
+# ------------------------------- Generator -----------------------------------
+
+def bench_refresh(sublime, count):
+    '''Refreshes of `count` symbols of the bundled YAML: from scratch (the
+    icons exist), with nothing to do, and with `count` new symbols (rendered
+    by the fake TeX executables)'''
+    if os.name == "nt":
+        return {"refresh": {"skipped": "the fake TeX executables need a POSIX system"}}
+    try:
+        import yaml
+        generator = importlib.import_module(f"{PKG_NAME}.utils.icon_generator")
+    except ImportError as e:
+        return {"refresh": {"skipped": str(e)}}
+
+    with open(os.path.join(ROOT, "symbols.yaml"), "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    tables = []
+    left = count
+    for table in data.get("tables", []):
+        if left <= 0:
+            break
+        table = dict(table, symbols=table.get("symbols", [])[:left])
+        left -= len(table["symbols"])
+        tables.append(table)
+
+    user_dir = os.path.join(sublime.packages_path(), "User", PKG_NAME)
+    shutil.rmtree(user_dir, ignore_errors=True)
+    os.makedirs(user_dir)
+
+    def refresh(tables):
+        with open(generator.user_yaml_file, "w", encoding="utf-8") as f:
+            yaml.safe_dump({"tables": tables}, f, allow_unicode=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.ls_refresh_database()
+
+    path = os.environ.get("PATH", "")
+    os.environ["PATH"] = FAKE_TEX_DIR + os.pathsep + path
+    try:
+        results = {}
+        results["refresh/cold"], _ = measure(lambda: refresh(tables), 1)
+        results["refresh/unchanged"], _ = measure(lambda: refresh(tables), 3)
+        new_tables = [dict(t, symbols=[s + "{}" for s in t["symbols"]])
+                      for t in tables]
+        results["refresh/new symbols"], _ = measure(lambda: refresh(new_tables), 1)
+        with open(os.path.join(user_dir, generator.METADATA_FILE), "r",
+                  encoding="utf-8") as f:
+            rendered = sum(len(m["path"]) for m in json.load(f))
+        results["refresh/new symbols"]["icons"] = rendered
+    finally:
+        os.environ["PATH"] = path
+        generator.tex_workers.shutdown()
+    for stats in results.values():
+        stats["symbols"] = count - left
+    return results
+
+
+# ---------------------------------- Main ------------------------------------
+
+def compare(results, previous):
+    print(f"{'benchmark':40} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, stats in results.items():
+        old = previous.get(name, {})
+        if "median_ms" in stats and old.get("median_ms"):
+            ratio = stats["median_ms"] / old["median_ms"]
+            print(f"{name:40} {old['median_ms']:>10.3f} {stats['median_ms']:>10.3f} "
+                  f"{ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="JSON file to write (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--refresh-symbols", type=int, default=64,
+                        help="number of symbols of the refresh benchmarks (0: skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sublime, viewer = import_plugin(setup_packages(tmpdir))
+        results = bench_viewer(sublime, viewer, args.repeat)
+        if args.refresh_symbols > 0:
+            results.update(bench_refresh(sublime, args.refresh_symbols))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+'''Minimal stand-in for the Sublime Text `sublime` module, for running the
+plugin code outside Sublime Text (see benchmarks/bench.py)'''
+
+import os
+import re
+import json
+
+
+# ------------------------------- Configuration -----------------------------
+
+# Set by the benchmark before importing the plugin
+PACKAGES_PATH = os.environ.get("LATEXSYMBOLS_PACKAGES", "")
+
+
+# ---------------------------------- API ------------------------------------
+
+def packages_path():
+    return PACKAGES_PATH
+
+
+class Settings:
+    def __init__(self, values):
+        self.values = values
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+
+_settings = {}
+
+
+def load_settings(name):
+    if name not in _settings:
+        path = os.path.join(PACKAGES_PATH, "LaTeXSymbols", name)
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        # Sublime settings are JSON with comments and trailing commas
+        text = re.sub(r"^\s*//.*$|\s+//[^\"\n]*$", "", text, flags=re.M)
+        text = re.sub(r",(\s*[}\]])", r"\1", text)
+        _settings[name] = Settings(json.loads(text))
+    return _settings[name]
+
+
+def set_timeout(callback, delay=0):
+    callback()
+
+
+def set_timeout_async(callback, delay=0):
+    callback()
+
+
+def status_message(message):
+    pass
+
+
+def error_message(message):
+    print(message)
+
+
+def set_clipboard(text):
+    pass
+
+
+class Region:
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
@@ -0,0 +1,23 @@
+'''Minimal stand-in for the Sublime Text `sublime_plugin` module'''
+
+
+class WindowCommand:
+    def __init__(self, window=None):
+        self.window = window
+
+
+class TextCommand:
+    def __init__(self, view=None):
+        self.view = view
+
+
+class ApplicationCommand:
+    pass
+
+
+class EventListener:
+    pass
+
+
+class ViewEventListener:
+    pass
@@ -1,25 +1,31 @@
 import sublime
 import sublime_plugin
 import os
-import shutil
-import json
+import sys
 import base64
+import shutil
 import threading
 from collections import OrderedDict
 from sublime_plugin import TextCommand
-from .utils.icon_generator import ls_refresh_database
+from .utils.icon_cache import icon_cache
+from .utils.symbol_store import symbol_store
+from .utils.perf import perf
+from .utils.png_tools import write_png
 
 
 # ------------------------------- Configuration -----------------------------
 
 st_pkgs_dir = sublime.packages_path()
 PKG_NAME = "LaTeXSymbols"
-METADATA_FILE = "symbols_data.json"
 popup_width = 2000
 popup_height = 600
+recent_queries = 16
+refresh_delay = 1000
+redraw_delay = 100
 icon_size = 16
 column_base_length = 21
 ls_settings = sublime.load_settings('LaTeXSymbols.sublime-settings')
+user_symbols_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, "symbols.yaml")
 
 
 # ------------------------------- Style sheets -------------------------------
@@ -74,32 +80,89 @@ insert {{ color: {insert_light};}}
 </style>"""
 
 
+# ---------------------------  HTML fragment cache  ---------------------------
+
+class FragmentCache:
+    '''Pre-rendered HTML of symbol cells, package headers and full pages.
+
+    Fragments only depend on the theme, the number of columns, the icon
+    size and the loaded database: the whole cache is dropped as soon as
+    one of them changes, or when the settings are edited. Symbol cells are
+    keyed by the identity of their record, which the store keeps alive for
+    as long as the database is not reloaded. Cell lookups are counted for
+    the timing report.
+    '''
+
+    def __init__(self):
+        self.key = None
+        self.cells = {}
+        self.headers = {}
+        self.pages = {}
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, key):
+        if key != self.key:
+            self.clear()
+            self.key = key
+
+    def clear(self):
+        self.cells = {}
+        self.headers = {}
+        self.pages = {}
+
+    def forget(self, symbol):
+        '''Drop the cells of `symbol`, and the pages that show them'''
+        for last in (False, True):
+            self.cells.pop((id(symbol), last), None)
+        self.pages = {}
+
+
+fragments = FragmentCache()
+
+
 # ------------------------------------  Helpers  ------------------------------------
 
 def load_symbols():
-    user_symbols_data = os.path.join(st_pkgs_dir, "User", PKG_NAME, METADATA_FILE)
-    ls_symbols_data = os.path.join(st_pkgs_dir, PKG_NAME, METADATA_FILE)
-    if os.path.isfile(user_symbols_data):
-        data_path = user_symbols_data
-    else:
-        data_path = ls_symbols_data
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return symbol_store.get()
 
 # ---------
 
-def image_to_base64(pkg_path):
-    abs_path = os.path.join(st_pkgs_dir, PKG_NAME, pkg_path)
-    try:
-        with open(abs_path, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
-    except Exception as e:
-        print(f"Error loading image: {abs_path}", e)
-        return None
+def fragment_key():
+    return (ls_settings.get('popup_theme'), ls_settings.get('columns_number'),
+            display_size(), symbol_store.generation)
+
+# ---------
+
+def display_size():
+    '''Size of the embedded icons: twice the displayed size for HiDPI'''
+    return 2 * icon_size if ls_settings.get('hidpi_icons') else icon_size
 
 # ---------
 
-def generate_html(grouped, special_search=None, key=None):
+def theme_color():
+    return "white" if ls_settings.get('popup_theme') == "dark" else "black"
+
+# ---------
+
+placeholders = {}
+
+def placeholder_icon(size):
+    '''Base64 PNG shown in place of the icons that are not rendered yet'''
+    if size not in placeholders:
+        data = write_png(size, size, [128, 128, 128, 64] * (size * size))
+        placeholders[size] = base64.b64encode(data).decode("utf-8")
+    return placeholders[size]
+
+# ---------
+
+def generate_html(grouped, special_search=None, key=None, page=None, 
+                  truncated=()):
+    with perf.stage("generate_html"):
+        return _generate_html(grouped, special_search, key, page, truncated)
+
+
+def _generate_html(grouped, special_search, key, page, truncated):
 
     max_per_row = ls_settings.get('columns_number')
     if max_per_row < 1 or max_per_row > 6:
@@ -121,58 +184,82 @@ def generate_html(grouped, special_search=None, key=None):
         info = " — Filter: " + key
     else:
         info = ""
-    html = f"<html><body><h1>LaTeX Symbols{info}</h1><br>"
-    html += STYLE
-
-    for package in sorted(grouped.keys(), key=sort_key):
-        symbols = grouped[package]
-        html += f'<h3><a href="{package}">📦 {package}</a></h3>'
+    html = [f"<html><body><h1>LaTeX Symbols{info}</h1><br>", STYLE]
+    if page:
+        html.append(page_navigation(*page))
+
+    fragments.validate(fragment_key())
+    for package, symbols in grouped:
+        header_key = (package, package in truncated)
+        header = fragments.headers.get(header_key)
+        if header is None:
+            header = fragments.headers[header_key] = package_header(*header_key)
+        html.append(header)
 
         for i in range(0, len(symbols), max_per_row):
             row = symbols[i:i + max_per_row]
-            html += "<div><li>"
+            html.append("<div><li>")
 
             for j, s in enumerate(row):
-                name = s["name"]
-                if j < max_per_row -1:
-                    spaces = "&nbsp;" * (column_base_length - len(name))
-                else:
-                    spaces = ""
-                icon_path = os.path.join(st_pkgs_dir, s["path"][color])
-                encoded = image_to_base64(icon_path)
-                if s["type"] == "both":
-                    type = "<type-b>Ⓑ</type-b>"
-                elif s["type"] == "math":
-                    type = "<type-m>Ⓜ</type-m>"
+                last = j == max_per_row - 1
+                cell_key = (id(s), last)
+                cell = fragments.cells.get(cell_key)
+                if cell is None:
+                    fragments.misses += 1
+                    cell = fragments.cells[cell_key] = symbol_cell(s, color, last)
                 else:
-                    type = "<type-t>Ⓣ</type-t>"
-                html += f'''&nbsp;{type}
+                    fragments.hits += 1
+                html.append(cell)
+            html.append("</li></div>")
+        html.append("<br>")
+    if page:
+        html.append(page_navigation(*page))
+    html.append("</body></html>")
+    return "".join(html)
+
+# ---------
+
+def package_header(package, truncated):
+    if truncated:
+        more = f' <a href="more-{package}">(show all)</a>'
+    else:
+        more = ""
+    return f'<h3><a href="{package}">📦 {package}</a>{more}</h3>'
+
+# ---------
+
+def symbol_cell(s, color, last):
+    name = s.name
+    if not last:
+        spaces = "&nbsp;" * (column_base_length - len(name))
+    else:
+        spaces = ""
+    icon_path = s.icon_path(color) or lazy_icons.icon_path(s, color)
+    if icon_path is None:
+        encoded = placeholder_icon(display_size())
+    else:
+        with perf.stage("generate_html: icon read"):
+            encoded = icon_cache.get(icon_path, color, display_size())
+    if s.type == "both":
+        type = "<type-b>Ⓑ</type-b>"
+    elif s.type == "math":
+        type = "<type-m>Ⓜ</type-m>"
+    else:
+        type = "<type-t>Ⓣ</type-t>"
+    return f'''&nbsp;{type}
                             <img src="data:image/png;base64,{encoded}" 
                             width="{icon_size}" height="{icon_size}">
                             <a href="{name}"><span class="latex-sym">
                             {name}</span></a>
                             <a href="ins-{name}" ><insert>⎀</insert></a>{spaces}
                             '''
-            html += "</li></div>"
-        html += "<br>"
-    html += "</body></html>"
-    return html
 
 # ---------
 
-def grouped_symbols(filtered):
-    grouped = OrderedDict()
-    for symbol in filtered:
-        package = symbol.get("package", "Unknown")
-        if package not in grouped:
-            grouped[package] = []
-        grouped[package].append(symbol)
-    return grouped
-
-# ---------
-
-def sort_key(package_name):
-    return (0, "") if package_name == "latex" else (1, package_name.lower())
+def page_navigation(page, page_count):
+    prev_link = '<a href="page-prev">◀ previous</a>' if page > 0 else ""
+    next_link = '<a href="page-next">next ▶</a>' if page < page_count - 1 else ""
+    return f"<div>{prev_link} Page {page + 1}/{page_count} {next_link}</div><br>"
 
 # ---------
 
@@ -184,14 +271,135 @@ def mid_point(view):
     middle_row = (row_a + row_b) / 2 - 3
     return view.text_point(middle_row, 10)
 
+# ---------
+
+def warm_up():
+    '''Load the database, build the search index and encode the icons of the
+    first page (or all of them with `icon_cache_warm_up`), so that the
+    first popup does not wait for them'''
+    try:
+        views = symbol_store.views()
+        views.index()
+        symbols = views.ordered
+        if not ls_settings.get('icon_cache_warm_up'):
+            symbols = symbols[:ls_settings.get('page_size', 0) or len(symbols)]
+        icon_cache.warm_up(symbols, theme_color(), display_size())
+    except Exception as e:
+        print("[LaTeXSymbols] Warm-up failed:", e)
+
+# ---------
+
+def on_settings_changed():
+    fragments.clear()
+    perf.enabled = bool(ls_settings.get('instrumentation', False))
+
+# ---------
+
+def plugin_loaded():
+    ls_settings.add_on_change(PKG_NAME, on_settings_changed)
+    perf.enabled = bool(ls_settings.get('instrumentation', False))
+    icon_cache.resize(ls_settings.get('icon_cache_size_mb', 24) * 1024 * 1024)
+    if ls_settings.get('warm_up_on_load', True):
+        threading.Thread(target=warm_up, daemon=True).start()
+
+
+def plugin_unloaded():
+    ls_settings.clear_on_change(PKG_NAME)
+    # Stop the rendering threads, if the generator has been loaded
+    generator = sys.modules.get(f"{__package__}.utils.icon_generator")
+    if generator is not None:
+        generator.tex_workers.shutdown()
+
+# ---------------------------  Displayed results  -----------------------------
+
+class ResultPages:
+    '''Results displayed in a popup, and the page and package shown.
+
+    Ranks of `views` in display order or, if `ranked`, in the order of the
+    given ordinals (best first). Built off the UI thread by the live filter,
+    then only changed on the UI thread (by clicks on the popup links).
+    '''
+
+    def __init__(self, views, ordinals, special_search, key, ranked=False):
+        self.views = views
+        if views is None:
+            self.results = []
+        elif ranked:
+            self.results = views.ranked(ordinals)
+        else:
+            self.results = views.ranks(ordinals)
+        self.special_search = special_search
+        self.key = key
+        self.page = 0
+        self.focus_package = None
+
+    def page_html(self):
+        '''HTML of the current page only, or of all results without paging'''
+        results = self.results
+        if self.focus_package is not None:
+            results = self.views.in_package(results, self.focus_package)
+
+        page_size = ls_settings.get('page_size', 0)
+
+        # The unfiltered view never changes: memoize its pages outright
+        memo_key = None
+        if self.special_search == "search" and not self.key and self.focus_package is None:
+            fragments.validate(fragment_key())
+            memo_key = (page_size, self.page)
+            if memo_key in fragments.pages:
+                return fragments.pages[memo_key]
+
+        html = self._page_html(results, page_size)
+        if memo_key is not None:
+            fragments.pages[memo_key] = html
+        return html
+
+    def _page_html(self, results, page_size):
+        if page_size < 1 or len(results) <= page_size:
+            return generate_html(self.views.grouped(results),
+                                 special_search=self.special_search, key=self.key)
+
+        page_count = (len(results) + page_size - 1) // page_size
+        self.page = min(max(self.page, 0), page_count - 1)
+        start = self.page * page_size
+        end = start + page_size
+        page = results[start:end]
+
+        # Packages cut by the page boundaries get a "show all" link
+        truncated = set()
+        if self.focus_package is None:
+            ordered = self.views.ordered
+            first, last = ordered[page[0]].package, ordered[page[-1]].package
+            if start > 0 and ordered[results[start - 1]].package == first:
+                truncated.add(first)
+            if end < len(results) and ordered[results[end]].package == last:
+                truncated.add(last)
+
+        return generate_html(self.views.grouped(page),
+                             special_search=self.special_search, key=self.key,
+                             page=(self.page, page_count), truncated=truncated)
+
+
 # ----------------------------  Session state  --------------------------------
 
 class SymbolSearchSession:
 
+    # Session of the last popup shown, to refresh when the database is
+    # updated or when an icon has been rendered
+    active = None
+
     def __init__(self, view):
         self.view = view
         self.symbols = load_symbols()
         self.last_filter_text = ""
+        self.views = None
+        self.index = None
+        self.search_mode = None
+        self.last_query = None
+        self.last_results = None
+        self.recent_results = OrderedDict()
+        self.lock = threading.Lock()
+        self.state = ResultPages(None, [], None, None)
         at_caret = ls_settings.get('at_caret')
         if at_caret:
             self.fixed_location = -1
@@ -200,6 +408,7 @@ class SymbolSearchSession:
             # self.fixed_location = visible_reg.a
             row_a = view.rowcol(visible_reg.a)[0]
             self.fixed_location = view.text_point(row_a, 20)
+        self.location = self.fixed_location
 
 # ---------
 
@@ -209,40 +418,125 @@ class SymbolSearchSession:
 
 # ---------
 
-    def update_popup(self, filter_text):
+    def filter_symbols(self, filter_text):
+        '''Ordinals of the matching symbols, narrowed from the previous
+        results when the filter text has only been extended. In "fuzzy"
+        search mode, only the `max_results` best matches are kept.'''
+        with self.lock:
+            return self._filter_symbols(filter_text)
+
+    def _filter_symbols(self, filter_text):
+        views = symbol_store.views()
+        index = views.index()
+        search_mode = ls_settings.get('search_mode', "fuzzy")
+        if index is not self.index or search_mode != self.search_mode:
+            self.views = views
+            self.index = index
+            self.search_mode = search_mode
+            self.last_query = None
+            self.last_results = None
+            self.recent_results.clear()
+
+        fuzzy = search_mode == "fuzzy"
+        if fuzzy:
+            filter_text = filter_text.strip().lower()
+
+        # Fuzzy results are kept as {ordinal: score} of every match, so that
+        # longer queries can be narrowed from them
+        if filter_text in self.recent_results:
+            self.recent_results.move_to_end(filter_text)
+            results = self.recent_results[filter_text]
+        elif (
+            self.last_query
+            and self.last_query in filter_text
+            and filter_text == filter_text.strip()
+            ):
+            if fuzzy:
+                results = index.fuzzy_search(filter_text, self.last_results)
+            else:
+                results = [i for i in self.last_results
+                           if index.matches(i, filter_text)]
+        elif fuzzy and filter_text:
+            results = index.fuzzy_search(filter_text)
+        else:
+            results = index.search(filter_text)
 
-        def matches(s):
-            if (
-                filter_text in s.get("name", "").lower() 
-                or filter_text.strip() == s.get("name", "").lower().lstrip('\\')
-                ):
-                return True
-            if filter_text in s.get("package", "").lower(): 
-                return True
-            keywords = s.get("keywords", [])
-            if isinstance(keywords, list):
-                for kw in keywords:
-                    if isinstance(kw, str) and filter_text in kw.lower():
-                        return True
-            return False
-
-        filtered = [s for s in self.symbols if matches(s)]
-
-        grouped = grouped_symbols(filtered)
-        html = generate_html(grouped, special_search="search", key=filter_text)
-
-        self.view.show_popup(
-            html,
-            location= self.fixed_location,
-            max_width=popup_width,
-            max_height=popup_height,
-            on_navigate=self.on_click
-        )
+        self.last_query = filter_text
+        self.last_results = results
+        self.recent_results[filter_text] = results
+        if len(self.recent_results) > recent_queries:
+            self.recent_results.popitem(last=False)
+        if fuzzy and filter_text:
+            return index.top(results, ls_settings.get('max_results', 100))
+        return results
+
+# ---------
+
+    def update_popup(self, filter_text):
+        self.state, html = self.build(filter_text)
+        self.show_html(html)
+
+    def build(self, filter_text):
+        '''(results, HTML of their first page) of `filter_text`. The session
+        is left as is: the results are only displayed by whoever shows the
+        HTML, on the UI thread.'''
+        with perf.stage("popup: filter"):
+            with self.lock:
+                ordinals = self._filter_symbols(filter_text)
+                views = self.views
+                # Fuzzy matches are displayed best first
+                ranked = self.search_mode == "fuzzy" and bool(filter_text.strip())
+        with perf.stage("popup: layout"):
+            state = ResultPages(views, ordinals, "search", filter_text, ranked)
+        with perf.stage("popup: page html"):
+            return state, state.page_html()
+
+    def set_results(self, views, ordinals, special_search, key, ranked=False):
+        '''Display the given symbols of `views`, from the first page'''
+        self.state = ResultPages(views, ordinals, special_search, key, ranked)
+
+    def page_html(self):
+        return self.state.page_html()
+
+    def refresh_popup(self):
+        '''Re-render the live filter popup, if still open, after the
+        database has been updated'''
+        if self.state.special_search != "search" or not self.view.is_popup_visible():
+            return
+        self.update_popup(self.state.key)
+
+    def redraw(self):
+        '''Re-render the current page, if the popup is still open'''
+        if self.view.is_popup_visible():
+            self.show_html(self.page_html())
+
+    def show_html(self, html, location=None):
+        # Icons rendered on demand are swapped into the last popup shown
+        SymbolSearchSession.active = self
+        if location is not None:
+            self.location = location
+        with perf.stage("popup: show_popup"):
+            self.view.show_popup(
+                html,
+                location= self.location,
+                max_width=popup_width,
+                max_height=popup_height,
+                on_navigate=self.on_click
+            )
 
 # ---------
 
     def on_click(self, href):
-        if href.startswith("ins-"):
+        if href in ("page-next", "page-prev"):
+            self.state.page += 1 if href == "page-next" else -1
+            self.show_html(self.page_html())
+
+        elif href.startswith("more-"):
+            self.state.focus_package = href[5:]
+            self.state.page = 0
+            self.show_html(self.page_html())
+
+        elif href.startswith("ins-"):
             self.view.run_command('ls_insert_in_view', 
                                  {'text': href[4:]})
             self.view.hide_popup()
@@ -261,14 +555,141 @@ class SymbolSearchSession:
         pass
 
 
+# ---------------------------  Render scheduler  ------------------------------
+
+class RenderScheduler:
+    '''Debounced, cancellable rendering of the live filter popup.
+
+    Filtering and HTML building run on the async thread once the input has
+    been idle for `filter_debounce_ms`. Every new request bumps the
+    generation counter, so renders overtaken by newer input are dropped
+    and only the latest results and HTML are handed back to the UI thread,
+which is the only one to change the session.
+    '''
+
+    def __init__(self, session):
+        self.session = session
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def schedule(self, filter_text):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        delay = ls_settings.get('filter_debounce_ms', 60)
+        sublime.set_timeout_async(
+            lambda: self.render(generation, filter_text), delay)
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+
+    def render(self, generation, filter_text):
+        if generation != self.generation:
+            return
+        state, html = self.session.build(filter_text)
+        if generation != self.generation:
+            return
+        sublime.set_timeout(lambda: self.show(generation, state, html))
+
+    def show(self, generation, state, html):
+        # Only the UI thread changes the displayed results
+        if generation == self.generation:
+            self.session.state = state
+            self.session.show_html(html)
+
+
+# ------------------------------  Lazy icons  ---------------------------------
+
+class LazyIcons:
+    '''On-demand rendering of the icons the database lists as missing.
+
+    With `lazy_icons`, saving symbols.yaml lists new symbols at once, with a
+    placeholder icon, instead of rendering all their icons first. The
+    first time the cell of such a symbol is built, its icon is queued on
+    the generator's TeX workers, ahead of any refresh. Once it is ready,
+    the cell is dropped from the fragment cache and the last popup shown
+    is redrawn (at most every `redraw_delay` ms). Icons that fail are
+    recorded in the failure cache by the generator, so that the next
+    update drops their symbol, and are not requested again meanwhile.
+    '''
+
+    def __init__(self):
+        self.requested = set()
+        self.rendered = {}
+        self.redraw_scheduled = False
+        self.lock = threading.Lock()
+
+    def icon_path(self, s, color):
+        '''Path of the icon of `s` if it has been rendered, else None (and
+        its rendering is queued, once)'''
+        key = (s.name, s.package, color)
+        with self.lock:
+            if key in self.rendered:
+                return self.rendered[key]
+            if key in self.requested or not ls_settings.get('lazy_icons', True):
+                return None
+            self.requested.add(key)
+        # Importing the generator is slow the first time: not on this thread
+        sublime.set_timeout_async(lambda: self.submit(s, key))
+        return None
+
+    def reset(self):
+        with self.lock:
+            self.requested.clear()
+            self.rendered.clear()
+
+    def submit(self, s, key):
+        try:
+            from .utils.icon_generator import (render_on_demand, tex_workers,
+                                               worker_count)
+        except ImportError as e:
+            print("[LaTeXSymbols] Icons cannot be rendered:", e)
+            return
+        tex_workers.resize(worker_count())
+        future = tex_workers.submit(render_on_demand, *key, priority=-1)
+        future.add_done_callback(lambda f: self.done(s, key, f))
+
+    def done(self, s, key, future):
+        if future.cancelled():
+            return
+        try:
+            icon_path, status = future.result()
+        except Exception as e:
+            icon_path, status = None, e
+        if icon_path is None:
+            print(f"[LaTeXSymbols] The icon of {s.name} ({key[2]}) could not "
+                  f"be rendered: {status}")
+            return
+        with self.lock:
+            self.rendered[key] = icon_path
+            fragments.forget(s)
+            if self.redraw_scheduled:
+                return
+            self.redraw_scheduled = True
+        sublime.set_timeout(self.redraw, redraw_delay)
+
+    def redraw(self):
+        with self.lock:
+            self.redraw_scheduled = False
+        session = SymbolSearchSession.active
+        if session is not None:
+            session.redraw()
+
+
+lazy_icons = LazyIcons()
+
+
 # -------------  Command to display symbols and start filtering --------------
 
 class LiveFilterLatexSymbolsCommand(sublime_plugin.WindowCommand):
 
     def run(self):
         self.session = SymbolSearchSession(self.window.active_view())
+        SymbolSearchSession.active = self.session
+        self.scheduler = RenderScheduler(self.session)
 
-        sublime.set_timeout(lambda: self.session.update_popup(""), 100)
+        self.scheduler.schedule("")
         self.window.show_input_panel(
             "Filter LaTeX Symbols:", "",
             self.on_done,
@@ -277,12 +698,14 @@ class LiveFilterLatexSymbolsCommand(sublime_plugin.WindowCommand):
         )
 
     def on_change(self, input_text):
-        self.session.update_popup(input_text)
+        self.scheduler.schedule(input_text)
 
     def on_done(self, input_text):
+        self.scheduler.cancel()
         self.session.update_popup(input_text)
 
     def on_cancel(self):
+        self.scheduler.cancel()
         self.window.active_view().hide_popup()
 
 
@@ -290,15 +713,7 @@ class LiveFilterLatexSymbolsCommand(sublime_plugin.WindowCommand):
 
 class LatexSymbolsByKeywordCommand(sublime_plugin.WindowCommand):
     def run(self):
-        self.symbols = load_symbols()
-        keywords = set()
-        for s in self.symbols:
-            kws = s.get("keywords", [])
-            if isinstance(kws, list):
-                for kw in kws:
-                    if isinstance(kw, str): keywords.add(kw)
-
-        self.keywords = sorted(keywords)
+        self.keywords = symbol_store.views().keywords
 
         self.window.show_quick_panel(
             self.keywords,
@@ -329,23 +744,10 @@ class LatexSymbolsByKeywordCommand(sublime_plugin.WindowCommand):
         view = self.window.active_view()
         self.session = SymbolSearchSession(view)
 
-        def matches(symbol):
-            kws = symbol.get("keywords", [])
-            if isinstance(kws, list):
-                return keyword.lower() in [k.lower() for k in kws if isinstance(k, str)]
-            return False
-
-        filtered = [s for s in self.session.symbols if matches(s)]
-        grouped = grouped_symbols(filtered)
-        html = generate_html(grouped, special_search="keyword", key=keyword)
-
-        view.show_popup(
-            html,
-            location=popup_loc,
-            max_width=popup_width,
-            max_height=popup_height,
-            on_navigate=self.session.on_click
-        )
+        views = symbol_store.views()
+        self.session.set_results(views, views.index().with_keyword(keyword),
+                                 "keyword", keyword)
+        self.session.show_html(self.session.page_html(), popup_loc)
 
 
 # ---------- Command to display symbols corresponding to a package -----------
@@ -353,12 +755,7 @@ class LatexSymbolsByKeywordCommand(sublime_plugin.WindowCommand):
 class LatexSymbolsByPackageCommand(sublime_plugin.WindowCommand):
 
     def run(self):
-        self.symbols = load_symbols()
-        self.packages = sorted(set(
-            s.get("package", "").strip()
-            for s in self.symbols
-            if isinstance(s.get("package"), str) and s.get("package").strip()
-        ))
+        self.packages = symbol_store.views().packages
 
         self.window.show_quick_panel(
             self.packages,
@@ -394,45 +791,114 @@ class LatexSymbolsByPackageCommand(sublime_plugin.WindowCommand):
         view = self.window.active_view()
         self.session = SymbolSearchSession(view)
 
-        def matches(symbol):
-            return symbol.get("package", "").lower() == package.lower()
+        views = symbol_store.views()
+        self.session.set_results(views, views.index().with_package(package),
+                                 "package", package)
+        self.session.show_html(self.session.page_html(), popup_loc)
 
-        filtered = [s for s in self.session.symbols if matches(s)]
-        grouped = grouped_symbols(filtered)
-        html = generate_html(grouped, special_search="package", key=package)
 
-        view.show_popup(
-            html,
-            location=popup_loc,
-            max_width=popup_width,
-            max_height=popup_height,
-            on_navigate=self.session.on_click
-        )
+# ---------------------------  Timing report  ---------------------------------
+
+class LatexSymbolsTimingReportCommand(sublime_plugin.WindowCommand):
+    '''Prints the timings recorded with the `instrumentation` setting'''
+
+    def run(self):
+        if not perf.enabled:
+            print("[LaTeXSymbols] Set \"instrumentation\": true in the settings "
+                  "to record timings.")
+        print(perf.report(caches=[
+            ("icon cache", icon_cache.hits, icon_cache.misses),
+            ("HTML cells", fragments.hits, fragments.misses),
+        ]))
+        self.window.run_command("show_panel", {"panel": "console"})
 
 
 # --------------------------  Refresh database  -------------------------------
 
+refresh_lock = threading.Lock()
+
+
+def on_metadata_written():
+    # The generator swaps the new metadata in atomically: reload it and
+    # update the open popup, if any
+    symbol_store.reload()
+    icon_cache.invalidate()
+    fragments.clear()
+    lazy_icons.reset()
+    session = SymbolSearchSession.active
+    if session is not None:
+        sublime.set_timeout(session.refresh_popup)
+
+
+def on_refresh_progress(done, total):
+    sublime.status_message(f"LaTeXSymbols: rendering icons ({done}/{total})")
+
+
 class RunIconGeneratorThread(threading.Thread):
-    def __init__(self, window):
+    def __init__(self, window, retry_failed=False, lazy=False):
         threading.Thread.__init__(self)
         self.window = window
+        self.retry_failed = retry_failed
+        self.lazy = lazy
 
     def run(self):
-        try:
-            ls_refresh_database(),
-        except Exception as e:
-            sublime.error_message(f"[LaTeXSymbols] Error running script:\n{e}")
+        # Manual and automatic refreshes never run concurrently
+        with refresh_lock:
+            try:
+                # Only needed here: keeps yaml, subprocess, etc. out of the
+                # plugin start-up
+                from .utils.icon_generator import ls_refresh_database
+                ls_refresh_database(on_metadata_written=on_metadata_written,
+                                    on_progress=on_refresh_progress,
+                                    release_icons=icon_cache.invalidate,
+                                    retry_failed=self.retry_failed,
+                                    lazy=self.lazy)
+                sublime.status_message("LaTeXSymbols: database updated")
+            except Exception as e:
+                sublime.error_message(f"[LaTeXSymbols] Error running script:\n{e}")
+            finally:
+                # New icons may have been written under already known paths
+                icon_cache.invalidate()
+                fragments.clear()
 
 
 class LatexSymbolsRefreshCommand(sublime_plugin.WindowCommand):
-    def run(self):
-        thread = RunIconGeneratorThread(self.window)
+    def run(self, retry_failed=False):
+        thread = RunIconGeneratorThread(self.window, retry_failed)
         thread.start()
 
     def is_enabled(self):
         return True
 
 
+class SymbolsFileListener(sublime_plugin.EventListener):
+    '''Updates the database in the background when the user symbols.yaml
+    is saved. Saves in quick succession only trigger one refresh, which
+    only renders the entries that changed.'''
+
+    generation = 0
+
+    def on_post_save_async(self, view):
+        file_name = view.file_name()
+        if not file_name or not ls_settings.get('refresh_on_save', True):
+            return
+        if os.path.normcase(os.path.realpath(file_name)) != \
+                os.path.normcase(os.path.realpath(user_symbols_file)):
+            return
+
+        SymbolsFileListener.generation += 1
+        generation = SymbolsFileListener.generation
+        sublime.set_timeout_async(
+            lambda: self.refresh(view, generation), refresh_delay)
+
+    def refresh(self, view, generation):
+        if generation != SymbolsFileListener.generation:
+            return
+        sublime.status_message("LaTeXSymbols: updating the database...")
+        RunIconGeneratorThread(view.window(),
+                               lazy=ls_settings.get('lazy_icons', True)).start()
+
+
 # --------------- Command to customize the symbols.yaml file -----------------
 
 class EditSymbolsFileCommand(sublime_plugin.WindowCommand):
@@ -0,0 +1,135 @@
+'''Pixel checks of the in-process PNG tools against the bundled icons.
+
+    python -m unittest discover tests    (or: python -m pytest tests)
+
+png_tools does not depend on Sublime Text and is imported directly.
+'''
+
+import os
+import sys
+import unittest
+
+
+# ------------------------------- Configuration -----------------------------
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ICON_SIZE = 64
+# Icons of each color resized by the (slower) resizing tests
+RESIZE_SAMPLE = 40
+
+sys.path.insert(0, os.path.join(ROOT, "utils"))
+import png_tools  # noqa: E402
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def bundled_icons(limit=None):
+    for color in ("white", "black"):
+        directory = os.path.join(ROOT, "icons", color)
+        names = sorted(n for n in os.listdir(directory) if n.endswith(".png"))
+        for name in names[:limit]:
+            with open(os.path.join(directory, name), "rb") as f:
+                yield f"{color}/{name}", f.read()
+
+# ------------
+
+def visible_pixels(pixels):
+    '''RGBA pixels, with the color of fully transparent pixels ignored'''
+    return [tuple(pixels[i:i + 4]) if pixels[i + 3] else (0, 0, 0, 0)
+            for i in range(0, len(pixels), 4)]
+
+# ------------
+
+def premultiplied(pixels):
+    return [v * pixels[i + 3] / 255 for i in range(0, len(pixels), 4)
+            for v in pixels[i:i + 3]] + list(pixels[3::4])
+
+# ------------
+
+def visible_area(width, height, pixels):
+    '''(left, top, right, bottom) of the non-transparent pixels'''
+    points = [(p % width, p // width) for p in range(width * height)
+              if pixels[4 * p + 3]]
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return min(xs), min(ys), max(xs) + 1, max(ys) + 1
+
+# ------------
+
+def crop_and_scale(width, pixels, area, factor):
+    '''PNG of the `area` of an image, enlarged `factor` times by pixel
+    replication'''
+    left, top, right, bottom = area
+    out = []
+    for y in range(top, bottom):
+        row = []
+        for x in range(left, right):
+            row += pixels[4 * (y * width + x):4 * (y * width + x) + 4] * factor
+        out += row * factor
+    return png_tools.write_png(factor * (right - left), factor * (bottom - top), out)
+
+# ------------
+
+def max_difference(data, other):
+    a = premultiplied(png_tools.read_png(data)[2])
+    b = premultiplied(png_tools.read_png(other)[2])
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+# ---------------------------------- Tests ----------------------------------
+
+class BundledIconsTest(unittest.TestCase):
+
+    def test_round_trip_is_lossless(self):
+        for name, data in bundled_icons():
+            width, height, pixels = png_tools.read_png(data)
+            encoded = png_tools.write_png(width, height, pixels)
+            self.assertEqual(png_tools.read_png(encoded), (width, height, pixels),
+                             name)
+
+    def test_fit_icon_reproduces_bundled_icons(self):
+        for name, data in bundled_icons():
+            width, height, pixels = png_tools.read_png(data)
+            self.assertEqual((width, height), (ICON_SIZE, ICON_SIZE), name)
+            fitted = png_tools.fit_icon(data, ICON_SIZE, use_pillow=False)
+            fitted_width, fitted_height, fitted_pixels = png_tools.read_png(fitted)
+            self.assertEqual((fitted_width, fitted_height), (width, height), name)
+            self.assertEqual(visible_pixels(fitted_pixels), visible_pixels(pixels),
+                             name)
+
+    def test_fit_icon_shrinks_and_places_icons(self):
+        # An icon fills the square in at least one direction, bottom-centered:
+        # its visible area enlarged 3 times must be fitted back onto it
+        checked = 0
+        for name, data in bundled_icons(RESIZE_SAMPLE):
+            width, _, pixels = png_tools.read_png(data)
+            area = visible_area(width, ICON_SIZE, pixels)
+            left, top, right, bottom = area
+            if (
+                max(right - left, bottom - top) != ICON_SIZE
+                or bottom != ICON_SIZE
+                or left != (ICON_SIZE - (right - left)) // 2
+                ):
+                continue
+            enlarged = crop_and_scale(width, pixels, area, 3)
+            fitted = png_tools.fit_icon(enlarged, ICON_SIZE, use_pillow=False)
+            self.assertLessEqual(max_difference(fitted, data), 1, name)
+            checked += 1
+        self.assertGreater(checked, RESIZE_SAMPLE // 2)
+
+    def test_fit_icon_resizes_by_any_factor(self):
+        # Shrinking to 48 px: by a non-integer factor from the visible area,
+        # and by an integer factor from the same area enlarged 3 times
+        for name, data in bundled_icons(RESIZE_SAMPLE):
+            width, height, pixels = png_tools.read_png(data)
+            area = visible_area(width, height, pixels)
+            original = crop_and_scale(width, pixels, area, 1)
+            enlarged = crop_and_scale(width, pixels, area, 3)
+            fitted = png_tools.fit_icon(original, 48, use_pillow=False)
+            self.assertEqual(png_tools.read_png(fitted)[:2], (48, 48), name)
+            self.assertLessEqual(
+                max_difference(fitted, png_tools.fit_icon(enlarged, 48, use_pillow=False)),
+                2, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
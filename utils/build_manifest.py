@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def digest(*values):
+    text = json.dumps(values, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+# ------------
+
+def entry_key(symbol):
+    return f"{symbol.get('package') or 'latex'}:{symbol['command']}"
+
+# ------------
+
+def write_json_atomic(path, data, **kwargs):
+    '''Write `data` to a temporary file first, then swap it in, so that
+    readers never see a half-written file'''
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+# ------------------------------ Build manifest -------------------------------
+
+class BuildManifest:
+    '''Record of the last database refresh.
+
+    For every table entry, the manifest stores a hash of what its icons
+    depend on (command, package, fontenc, type and the generator settings),
+    a hash of its keywords, and the icons that were produced for it. The
+    next refresh compares the YAML against it to only render new or
+    changed entries.
+    '''
+
+    VERSION = 1
+
+    def __init__(self, path, settings_hash):
+        self.path = path
+        self.settings_hash = settings_hash
+        self.entries = {}
+
+    @classmethod
+    def load(cls, path, settings_hash):
+        manifest = cls(path, settings_hash)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") == cls.VERSION:
+            manifest.entries = data.get("entries", {})
+        return manifest
+
+    def render_hash(self, symbol):
+        return digest(symbol["command"], symbol.get("package"),
+                      symbol.get("fontenc"), symbol.get("type"),
+                      self.settings_hash)
+
+    def keywords_hash(self, symbol):
+        return digest(symbol.get("keywords"))
+
+    def save(self):
+        write_json_atomic(self.path, {
+            "version": self.VERSION,
+            "settings": self.settings_hash,
+            "entries": self.entries,
+        }, indent=1)
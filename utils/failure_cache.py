@@ -0,0 +1,103 @@
+import json
+import threading
+from .build_manifest import digest, write_json_atomic
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def log_excerpt(log_path, max_lines=20):
+    '''TeX error messages (lines starting with "!") and their context, or
+    the end of the log if there are none'''
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return ""
+    excerpt = []
+    for i, line in enumerate(lines):
+        if line.startswith("!"):
+            excerpt.extend(lines[i:i + 3])
+    return "\n".join((excerpt or lines)[-max_lines:])
+
+# ------------
+
+def read_entries(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# Serializes the writes of the refreshes and of the on-demand renders
+save_lock = threading.Lock()
+
+
+# ------------------------------- Failure cache -------------------------------
+
+class FailureCache:
+    '''Persisted record of the icons that could not be rendered.
+
+    Entries are keyed by the inputs of the icon (command, color, package,
+    fontenc, type and generator settings) and store the failure status and
+    an excerpt of the log, so that a refresh does not compile them again
+    until one of their inputs changes. Icons rendered on demand during a
+    refresh `record` their failures at once, and the refresh keeps them
+    when it saves its own cache.
+    '''
+
+    def __init__(self, path, settings_hash):
+        self.path = path
+        self.settings_hash = settings_hash
+        self.entries = {}
+        self.loaded = set()
+        self.used = set()
+
+    @classmethod
+    def load(cls, path, settings_hash):
+        cache = cls(path, settings_hash)
+        cache.entries = read_entries(path)
+        cache.loaded = set(cache.entries)
+        return cache
+
+    def key(self, symbol, color):
+        return digest(symbol["command"], color, symbol.get("package") or "latex",
+                      symbol.get("fontenc"), symbol.get("type"),
+                      self.settings_hash)
+
+    def get(self, symbol, color):
+        key = self.key(symbol, color)
+        self.used.add(key)
+        return self.entries.get(key)
+
+    def add(self, symbol, color, status, log=""):
+        key = self.key(symbol, color)
+        self.used.add(key)
+        self.entries[key] = {
+            "command": symbol["command"],
+            "package": symbol.get("package"),
+            "color": color,
+            "status": status,
+            "log": log,
+        }
+
+    def discard(self, symbol, color):
+        self.entries.pop(self.key(symbol, color), None)
+
+    def record(self, symbol, color, status, log=""):
+        '''Add a failure and write it at once, leaving the other entries as
+        they are on disk'''
+        with save_lock:
+            self.entries = read_entries(self.path)
+            self.add(symbol, color, status, log)
+            write_json_atomic(self.path, self.entries, indent=1)
+
+    def save(self):
+        with save_lock:
+            # Keep the failures recorded since the cache was loaded
+            for key, entry in read_entries(self.path).items():
+                if key not in self.loaded:
+                    self.entries.setdefault(key, entry)
+            # Forget the failures of symbols that are not in the YAML anymore
+            self.entries = {k: v for k, v in self.entries.items() if k in self.used}
+            write_json_atomic(self.path, self.entries, indent=1)
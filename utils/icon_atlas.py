@@ -0,0 +1,107 @@
+import os
+import json
+import mmap
+import struct
+
+
+# ------------------------------- Configuration -----------------------------
+
+ATLAS_MAGIC = b"LSATLAS1"
+HEADER = struct.Struct("<8sI")
+
+# Sizes of the pre-encoded icons embedded in the popup (32 px for HiDPI)
+DISPLAY_SIZES = (16, 32)
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def atlas_path(directory, color):
+    return os.path.join(directory, f"icons-{color}.atlas")
+
+# ------------
+
+def display_icons_path(directory, color, size):
+    '''Sidecar of ready-to-embed base64 icons of a given display size'''
+    return os.path.join(directory, f"icons-{color}-{size}.json")
+
+# ------------
+
+def posix_icon_path(icon_path):
+    '''Icon path with "/" separators, as atlases and sidecars are keyed
+    (databases written on Windows may use "\\")'''
+    return icon_path.replace("\\", "/")
+
+# ------------
+
+def load_display_icons(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# ------------
+
+def write_atlas(path, icons):
+    '''Pack {icon path: PNG bytes} into a single file: a header, a JSON index
+    of (offset, length) pairs, then the concatenated PNG files'''
+    index = {}
+    offset = 0
+    for icon_path, data in icons.items():
+        index[icon_path] = (offset, len(data))
+        offset += len(data)
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(ATLAS_MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for data in icons.values():
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+# -------------------------------- Icon atlas ---------------------------------
+
+class IconAtlas:
+    '''Read-only, memory-mapped view of an atlas written by `write_atlas`'''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_length = HEADER.unpack_from(self._map, 0)
+            if magic != ATLAS_MAGIC:
+                raise ValueError(f"Not an icon atlas: {path}")
+            start = HEADER.size
+            self._index = json.loads(self._map[start:start + index_length].decode("utf-8"))
+            self._data_start = start + index_length
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def open(cls, path):
+        '''The atlas at `path`, or None if it is missing or unreadable'''
+        if not os.path.isfile(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            print(f"Error loading icon atlas: {path}", e)
+            return None
+
+    def get(self, icon_path):
+        entry = self._index.get(icon_path)
+        if entry is None:
+            return None
+        offset, length = entry
+        start = self._data_start + offset
+        return self._map[start:start + length]
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
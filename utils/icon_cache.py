@@ -0,0 +1,144 @@
+import sublime
+import os
+import base64
+import threading
+from collections import OrderedDict
+from .icon_atlas import (IconAtlas, atlas_path, display_icons_path,
+                         load_display_icons, posix_icon_path)
+
+
+# ------------------------------- Configuration -----------------------------
+
+st_pkgs_dir = sublime.packages_path()
+PKG_NAME = "LaTeXSymbols"
+ICONS_DIR = "icons"
+DEFAULT_BUDGET = 24 * 1024 * 1024
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def image_to_base64(icon_path):
+    abs_path = os.path.join(st_pkgs_dir, icon_path)
+    try:
+        with open(abs_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    except Exception as e:
+        print(f"Error loading image: {abs_path}", e)
+        return None
+
+# ------------
+
+def icon_dirs():
+    return (os.path.join(st_pkgs_dir, "User", PKG_NAME, ICONS_DIR),
+            os.path.join(st_pkgs_dir, PKG_NAME, ICONS_DIR))
+
+# ------------
+
+def open_atlas(color):
+    '''The atlas of the user icons of the given color, or None'''
+    return IconAtlas.open(atlas_path(icon_dirs()[0], color))
+
+# ------------
+
+def open_display_icons(color, size):
+    '''The pre-encoded icons of the given color and display size: those
+    shipped with the package for the bundled icons, and those of the User
+    directory for the others'''
+    icons = {}
+    for directory in reversed(icon_dirs()):
+        icons.update(load_display_icons(display_icons_path(directory, color, size)) or {})
+    return icons
+
+
+# -------------------------------- Icon cache ---------------------------------
+
+class IconCache:
+    '''Process-wide LRU cache of base64-encoded icons.
+
+    Entries are keyed by (icon path, color) and evicted least recently used
+    first once their total size exceeds `max_bytes`. Missing icons are cached
+    as None so that re-rendering a popup never touches the disk twice.
+    Icons requested at a display size come ready-encoded from the sidecars
+    (shipped for the bundled icons, written by the generator for the user
+    icons). Full-size icons, the fallback, are sliced out of the
+    memory-mapped atlas of the user icons of their color when they are in
+    it, and read from their own file otherwise.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_BUDGET):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._atlases = {}
+        self._display_icons = {}
+        self._lock = threading.Lock()
+
+    def get(self, icon_path, color, size=None):
+        key = (icon_path, color, size)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        encoded = self._load(icon_path, color, size)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = encoded
+                self.size += len(encoded or "")
+                self._evict()
+        return encoded
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self):
+        '''Forget every icon and release the atlases (so that they can be
+        rewritten, even on Windows)'''
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            for atlas in self._atlases.values():
+                if atlas is not None:
+                    atlas.close()
+            self._atlases.clear()
+            self._display_icons.clear()
+
+    def warm_up(self, symbols, color, size=None):
+        for s in symbols:
+            icon_path = s.icon_path(color)
+            if icon_path:
+                self.get(icon_path, color, size)
+
+    def _load(self, icon_path, color, size):
+        key = posix_icon_path(icon_path)
+        if size is not None:
+            with self._lock:
+                if (color, size) not in self._display_icons:
+                    self._display_icons[color, size] = open_display_icons(color, size)
+                encoded = self._display_icons[color, size].get(key)
+            if encoded is not None:
+                return encoded
+
+        with self._lock:
+            if color not in self._atlases:
+                self._atlases[color] = open_atlas(color)
+            atlas = self._atlases[color]
+            data = atlas.get(key) if atlas is not None else None
+        if data is not None:
+            return base64.b64encode(data).decode("utf-8")
+        return image_to_base64(icon_path)
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, encoded = self._entries.popitem(last=False)
+            self.size -= len(encoded or "")
+
+
+icon_cache = IconCache()
@@ -4,10 +4,23 @@ import os
 import yaml
 import hashlib
 import json
+import base64
+import shutil
 import tempfile
+import posixpath
+import threading
 import subprocess
 from pathlib import Path
 from functools import partial
+from .png_tools import fit_icon, fit_icons, write_png
+from .build_manifest import BuildManifest, digest, entry_key, write_json_atomic
+from .failure_cache import FailureCache, log_excerpt
+from .symbol_pack import write_symbol_pack
+from .latex_format import FormatCache, tex_version
+from .tex_worker import TexWorkerPool
+from .perf import perf
+from .icon_atlas import (DISPLAY_SIZES, atlas_path, display_icons_path,
+                         load_display_icons, posix_icon_path, write_atlas)
 
 
 # ------------------------------- Configuration -----------------------------
@@ -17,35 +30,74 @@ INPUT_YAML = "symbols.yaml"
 PKG_NAME = "LaTeXSymbols"
 ICONS_DIR = "icons"
 METADATA_FILE = "symbols_data.json"
+PACK_FILE = "symbols_data.bin"
+MANIFEST_FILE = "symbols_manifest.json"
+FAILURES_FILE = "symbols_failures.json"
 
-user_icon_dir = os.path.join("User", PKG_NAME, ICONS_DIR)
+# Icon paths are stored with "/" separators, on every platform
+user_icon_dir = posixpath.join("User", PKG_NAME, ICONS_DIR)
 user_icon_dir_fullpath = os.path.join(st_pkgs_dir, "User", PKG_NAME, ICONS_DIR)
+package_icon_dir_fullpath = os.path.join(st_pkgs_dir, PKG_NAME, ICONS_DIR)
 user_yaml_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, INPUT_YAML)
 metadata_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, METADATA_FILE)
+pack_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, PACK_FILE)
+manifest_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, MANIFEST_FILE)
+failures_file = os.path.join(st_pkgs_dir, "User", PKG_NAME, FAILURES_FILE)
 user_log_dir = os.path.join(st_pkgs_dir, "User", PKG_NAME, "Logs")
+user_format_dir = os.path.join(st_pkgs_dir, "User", PKG_NAME, "Formats")
 
 COLORS = ["white", "black"]
 ICON_SIZE = "64x64"
 DPI = "600"
 GAMMA = "1"
 
-TEMPLATE = r"""
+# The preamble is shared by all the symbols of a package (and fontenc), and
+# can be precompiled into a format file
+PREAMBLE = r"""
 \documentclass[10pt]{{article}}
 \usepackage[utf8]{{inputenc}}
 \usepackage{{color}}
 {packages}
 \pagestyle{{empty}}
-\begin{{document}}
+"""
+
+DOCUMENT = r"""\begin{{document}}
 \color{{{color}}}
 {command}
 \end{{document}}
 """
 
+TEMPLATE = PREAMBLE + DOCUMENT
+
+# Maximum number of pages (one per symbol and color) of a batch document
+BATCH_SIZE = 32
+
+BATCH_DOCUMENT = r"""\begin{{document}}
+{pages}
+\end{{document}}
+"""
+
+BATCH_TEMPLATE = PREAMBLE + BATCH_DOCUMENT
+
+PAGE_TEMPLATE = r"""\begingroup
+\color{{{color}}}
+{command}
+\endgroup
+\clearpage
+"""
+
 # -------------------
 
 # Force real-time print output in ST console
 print = partial(print, flush=True)
 
+# Rendering threads shared by the refreshes and the on-demand renders
+tex_workers = TexWorkerPool()
+
+# YAML entries of the user symbols and formats of the on-demand renders
+on_demand = {"signature": None, "symbols": {}}
+on_demand_lock = threading.Lock()
+
 
 # ---------------------------------- Helpers --------------------------------
 
@@ -56,14 +108,128 @@ def hash_filename(command, color, package=None):
 
 # ------------
 
+def failure_log_path(symbol, color):
+    filename = hash_filename(symbol["command"], color, symbol.get("package"))
+    return os.path.join(user_log_dir, filename[:-4] + ".log")
+
+# ------------
+
+def preamble_packages(package, fontenc):
+    packages = ""
+    if package and package.lower() != "latex":
+        packages += f"\\usepackage{{{package}}}\n"
+    if fontenc:
+        packages += f"\\usepackage[{fontenc}]{{fontenc}}\n"
+    return packages
+
+# ------------
+
+def latex_body(symbol):
+    command = symbol["command"]
+    return f"${command}$" if symbol.get("type") == "math" else command
+
+# ------------
+
+def existing_icon(symbol, color):
+    filename = hash_filename(symbol["command"], color, symbol.get("package"))
+    icon_path_ls = posixpath.join(PKG_NAME, ICONS_DIR, color, filename)
+    icon_path_user = posixpath.join(user_icon_dir, color, filename)
+    if os.path.isfile(os.path.join(st_pkgs_dir, icon_path_ls)):
+        return icon_path_ls
+    elif os.path.isfile(os.path.join(st_pkgs_dir, icon_path_user)):
+        return icon_path_user
+    return None
+
+# ------------
+
+def resize_command(paths):
+    return ["mogrify",
+            "-resize", f'{ICON_SIZE}',
+            "-extent", f'{ICON_SIZE}',
+            "-background", "transparent",
+            "-gravity", "South",
+            #"center",
+            *paths,
+            ]
+
+# ------------
+
+def setting(name, default=None):
+    ls_settings = sublime.load_settings('LaTeXSymbols.sublime-settings')
+    return ls_settings.get(name, default)
+
+# ------------
+
+def resize_icons(paths):
+    '''Resize freshly rendered icons to ICON_SIZE, in-process unless the
+    `icon_resizer` setting asks for mogrify. Icons that cannot be decoded
+    in-process are still handed to mogrify.'''
+    resizer = setting('icon_resizer', "auto")
+    if resizer == "mogrify":
+        return run_command(resize_command(paths))
+
+    size = int(ICON_SIZE.split("x")[0])
+    for path in paths:
+        try:
+            with open(path, "rb") as f, perf.stage("refresh: resize"):
+                data = fit_icon(f.read(), size, use_pillow=resizer != "python")
+            with open(path, "wb") as f:
+                f.write(data)
+        except Exception as e:
+            print(f"In-process resizing failed for {path} ({e}), using mogrify")
+            if not run_command(resize_command([path])):
+                return False
+    return True
+
+# ------------
+
+def compile_latex(tex_path, preamble, document, formats=None, log_path=None):
+    '''Compile `preamble` + `document` into the DVI file next to `tex_path`,
+    against the precompiled format of the preamble if there is one (and
+    the usual way if that fails)'''
+    dvi_path = tex_path.with_suffix(".dvi")
+    format_path = formats.get(preamble) if formats else None
+    if format_path:
+        tex_path.write_text(document)
+        if (run_command(["latex",
+                         f"-fmt={format_path}",
+                         "-interaction=nonstopmode",
+                         f"-output-directory={tex_path.parent}",
+                         tex_path
+                         ])
+                and dvi_path.exists()):
+            return True
+        dvi_path.unlink(missing_ok=True)
+
+    tex_path.write_text(preamble + document)
+    success = run_command(["latex",
+                           "-interaction=nonstopmode",
+                           f"-output-directory={tex_path.parent}",
+                           tex_path
+                           ],
+                          log_path=log_path)
+    return success and dvi_path.exists()
+
+# ------------
+
 def run_command(command, log_path=None):
-    result = subprocess.run(
-        command, 
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.PIPE, 
-        shell=False,
-        text=True
-    )
+    timeout = setting('render_timeout', 60)
+    try:
+        with perf.stage(f"refresh: {os.path.basename(str(command[0]))}"):
+            result = subprocess.run(
+                command, 
+                stdout=subprocess.PIPE, 
+                stderr=subprocess.PIPE, 
+                shell=False,
+                text=True,
+                timeout=timeout
+            )
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed the stuck process
+        if log_path:
+            with open(log_path, "w", encoding="utf-8") as f:
+                f.write(f"! {command[0]} timed out after {timeout} s\n")
+        return False
     if result.returncode != 0 and log_path:
         with open(log_path, "wb") as f:
             f.write(bytes(result.stdout + "\n" + result.stderr, 'utf-8'))
@@ -72,50 +238,32 @@ def run_command(command, log_path=None):
 
 # ------------------------------- Icon generator ------------------------------
 
-def generate_icon(symbol, color):
+def generate_icon(symbol, color, force=False, formats=None):
     command = symbol["command"]
     package = symbol.get("package")
     fontenc = symbol.get("fontenc")
-    latex_command = f"${command}$" if symbol.get("type") == "math" else command
+    latex_command = latex_body(symbol)
     filename = hash_filename(command, color, package)
     
-    icon_path_ls = os.path.join(PKG_NAME, ICONS_DIR, color, filename)
-    icon_fullpath_ls = os.path.join(st_pkgs_dir, icon_path_ls)
-    icon_path_user = os.path.join(user_icon_dir, color, filename)
-    icon_fullpath_user = os.path.join(st_pkgs_dir, icon_path_user)
-    
-    if os.path.isfile(icon_fullpath_ls):
-        return icon_path_ls, "exists"
-    elif os.path.isfile(icon_fullpath_user):
-        return icon_path_user, "exists"
+    icon_path = None if force else existing_icon(symbol, color)
+    if icon_path:
+        return icon_path, "exists"
 
-    output_path = icon_fullpath_user
+    icon_path_user = posixpath.join(user_icon_dir, color, filename)
+    output_path = os.path.join(st_pkgs_dir, icon_path_user)
     
     with tempfile.TemporaryDirectory() as tmpdir:
         basename = "symbol"
         tex_path = Path(tmpdir) / f"{basename}.tex"
         dvi_path = Path(tmpdir) / f"{basename}.dvi"
-        # log_path = os.path.join(user_log_dir, f"{filename}.log")
-
-        packages = ""
-        if package and package.lower() != "latex":
-            packages += f"\\usepackage{{{package}}}\n"
-        if fontenc:
-            packages += f"\\usepackage[{fontenc}]{{fontenc}}\n"
+        log_path = failure_log_path(symbol, color)
 
-        tex_content = TEMPLATE.format(packages=packages, color=color, 
-                                      command=latex_command)
-        tex_path.write_text(tex_content)
+        preamble = PREAMBLE.format(packages=preamble_packages(package, fontenc))
+        document = DOCUMENT.format(color=color, command=latex_command)
 
         # Compile LaTeX
-        success = run_command(["latex",
-                               "-interaction=nonstopmode",
-                               f"-output-directory={tmpdir}",
-                               tex_path
-                            ],
-                        # log_path=log_path
-                        )
-        if not success or not dvi_path.exists():
+        success = compile_latex(tex_path, preamble, document, formats, log_path)
+        if not success:
             return None, "latex_failed"
 
         # Convert to PNG
@@ -127,33 +275,293 @@ def generate_icon(symbol, color):
                                "-o", f'{output_path}',
                                f"{dvi_path}"
                                ],
-                            # log_path=log_path,
+                            log_path=log_path,
                         )
         if not success:
             return None, "dvipng_failed"
 
-        # Resize with mogrify
-        success = run_command(["mogrify",
-                                "-resize", f'{ICON_SIZE}',
-                                "-extent", f'{ICON_SIZE}',
-                                "-background", "transparent",
-                                "-gravity", "South",
-                                #"center",
-                                f'{output_path}',
-                                ]
-                            # log_path=log_path,
-                        )
+        # Resize (in-process or with mogrify)
+        success = resize_icons([f'{output_path}'])
         if not success:
-            output_path.unlink(missing_ok=True)
+            Path(output_path).unlink(missing_ok=True)
             return None, "mogrify_failed"
 
     return icon_path_user, "generated"
 
+# ------------
+
+def generate_icons_batch(jobs, formats=None):
+    '''Render several (symbol, color) jobs sharing the same package and fontenc
+    
+    All jobs are compiled as the pages of a single LaTeX document, split into
+    PNGs by a single dvipng run and resized in one go. If any
+    step fails, each job is compiled on its own with `generate_icon` so that
+    the failing symbol(s) can be identified. Returns {job index: (path, status)}.
+    '''
+    symbol = jobs[0][0]
+    preamble = PREAMBLE.format(
+        packages=preamble_packages(symbol.get("package"), symbol.get("fontenc")))
+    pages = "".join(PAGE_TEMPLATE.format(color=color, command=latex_body(s))
+                    for s, color in jobs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tex_path = Path(tmpdir) / "batch.tex"
+        dvi_path = Path(tmpdir) / "batch.dvi"
+        success = compile_latex(tex_path, preamble,
+                                BATCH_DOCUMENT.format(pages=pages), formats)
+        if success:
+            success = run_command(["dvipng",
+                                   "-bg", "Transparent",
+                                   "-T", "tight",
+                                   "-D", f"{DPI}",
+                                   "--gamma", f"{GAMMA}",
+                                   "-o", os.path.join(tmpdir, "page%d.png"),
+                                   f"{dvi_path}"
+                                   ])
+        else:
+            success = False
+
+        # Empty pages are dropped by LaTeX: the page count must match exactly
+        page_paths = [os.path.join(tmpdir, f"page{i + 1}.png")
+                      for i in range(len(jobs))]
+        if success:
+            success = (all(os.path.isfile(p) for p in page_paths)
+                       and not os.path.isfile(
+                            os.path.join(tmpdir, f"page{len(jobs) + 1}.png")))
+
+        if success:
+            results = {}
+            output_paths = []
+            for i, ((s, color), page_path) in enumerate(zip(jobs, page_paths)):
+                filename = hash_filename(s["command"], color, s.get("package"))
+                icon_path_user = posixpath.join(user_icon_dir, color, filename)
+                output_path = os.path.join(st_pkgs_dir, icon_path_user)
+                shutil.move(page_path, output_path)
+                output_paths.append(output_path)
+                results[i] = (icon_path_user, "generated")
+
+            if resize_icons(output_paths):
+                return results
+            for output_path in output_paths:
+                Path(output_path).unlink(missing_ok=True)
+
+    return {i: generate_icon(s, color, force=True, formats=formats)
+            for i, (s, color) in enumerate(jobs)}
+
+# ------------
+
+def render_placeholders(jobs, formats=None):
+    '''Stand-in for `generate_icons_batch` (see `render_batch`) that runs
+    no process at all: every job gets a blank icon. The benchmarks render
+    through the fake TeX executables of benchmarks/fake_tex instead.'''
+    size = int(ICON_SIZE.split("x")[0])
+    data = write_png(size, size, [128, 128, 128, 64] * (size * size))
+    results = {}
+    for i, (s, color) in enumerate(jobs):
+        filename = hash_filename(s["command"], color, s.get("package"))
+        icon_path_user = posixpath.join(user_icon_dir, color, filename)
+        with open(os.path.join(st_pkgs_dir, icon_path_user), "wb") as f:
+            f.write(data)
+        results[i] = (icon_path_user, "generated")
+    return results
+
+
+# ------------------------------ On-demand icons -------------------------------
+
+def on_demand_symbol(command, package):
+    '''Entry of the user symbols.yaml, which is only parsed again when it
+    changes. The viewer lists the symbols without a package as "Unknown":
+    both are looked up like the refreshes key them (see `entry_key`).'''
+    st = os.stat(user_yaml_file)
+    signature = (st.st_mtime_ns, st.st_size)
+    if package == "Unknown":
+        package = None
+    with on_demand_lock:
+        if on_demand["signature"] != signature:
+            with open(user_yaml_file, "r", encoding="utf-8") as f:
+                symbols = read_symbols(yaml.safe_load(f))
+            on_demand["symbols"] = {entry_key(s): s for s in symbols}
+            on_demand["signature"] = signature
+        return on_demand["symbols"].get(
+            entry_key({"command": command, "package": package}))
+
+# ------------
+
+def on_demand_formats():
+    with on_demand_lock:
+        if "formats" not in on_demand:
+            version = None
+            if setting('precompiled_formats', True):
+                version = tex_version()
+            on_demand["formats"] = None if version is None else FormatCache(
+                user_format_dir, version, timeout=setting('render_timeout', 60))
+        return on_demand["formats"]
+
+# ------------
+
+def render_on_demand(command, package, color):
+    '''Render the icon of a symbol listed without one (see the `lazy`
+    refreshes). Returns (icon path, status) like `generate_icon`.'''
+    symbol = on_demand_symbol(command, package)
+    if symbol is None:
+        return None, "not_in_yaml"
+
+    # Failures are recorded like those of a refresh, which then drops the
+    # symbol instead of deferring it again
+    failures = FailureCache.load(failures_file, settings_hash())
+    failure = failures.get(symbol, color)
+    if failure:
+        return None, failure["status"]
+
+    Path(user_icon_dir_fullpath, color).mkdir(parents=True, exist_ok=True)
+    Path(user_log_dir).mkdir(parents=True, exist_ok=True)
+    # The icon is re-rendered even if it exists: its inputs may have changed
+    icon_path, status = generate_icon(symbol, color, force=True,
+                                      formats=on_demand_formats())
+    if icon_path is None:
+        failures.record(symbol, color, status,
+                        log_excerpt(failure_log_path(symbol, color)))
+    return icon_path, status
+
 
 # -------------------------------- Main Command --------------------------------
 
+def read_symbols(data):
+    symbols = []
+    for table in data.get("tables", []):
+        for command in table.get("symbols", []):
+            keywords = table.get("keywords", [])
+            if isinstance(keywords, str):
+                keywords = [keywords]
+
+            symbol_data = {
+                "command": command,
+                "package": table.get("package"),
+                "type": table.get("type"),
+                "keywords": keywords,
+            }
+            if "fontenc" in table:
+                symbol_data["fontenc"] = table["fontenc"]
+            symbols.append(symbol_data)
+    return symbols
+
+# ------------
+
+def settings_hash():
+    return digest(DPI, GAMMA, ICON_SIZE, TEMPLATE, BATCH_TEMPLATE, PAGE_TEMPLATE)
+
+# ------------
+
+def user_icons_exist(paths):
+    '''Whether the user icons among `paths` are still there (bundled icons
+    are not checked)'''
+    return all(os.path.isfile(os.path.join(st_pkgs_dir, path))
+               for path in paths.values()
+               if posix_icon_path(path).startswith(user_icon_dir))
+
+# ------------
+
+def remove_orphaned_icons(old_entries, entries):
+    '''Delete the user icons that no table entry refers to anymore'''
+    used = {posix_icon_path(path)
+            for entry in entries.values() for path in entry["paths"].values()}
+    removed = 0
+    for entry in old_entries.values():
+        for path in entry.get("paths", {}).values():
+            key = posix_icon_path(path)
+            if key in used or not key.startswith(user_icon_dir):
+                continue
+            used.add(key)
+            try:
+                os.remove(os.path.join(st_pkgs_dir, path))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+# ------------
+
+def write_atlases(metadata):
+    '''Pack the user icons referenced by the metadata into one atlas per
+    color: a fallback of the display icons, which spares reading their
+    files one at a time (the bundled icons are not packed)'''
+    for color in COLORS:
+        icons = {}
+        for m in metadata:
+            icon_path = m["path"].get(color)
+            if not icon_path:
+                continue
+            key = posix_icon_path(icon_path)
+            if key not in icons and key.startswith(user_icon_dir):
+                with open(os.path.join(st_pkgs_dir, icon_path), "rb") as f:
+                    icons[key] = f.read()
+        write_atlas(atlas_path(user_icon_dir_fullpath, color), icons)
+
+# ------------
+
+def write_display_icons(metadata, regenerated):
+    '''Write the ready-to-embed base64 icons of each color and display size.
+    Icons that were not regenerated are taken from the previous sidecars,
+    and the bundled icons are left to the sidecars shipped with the package.'''
+    for color in COLORS:
+        paths = {size: display_icons_path(user_icon_dir_fullpath, color, size)
+                 for size in DISPLAY_SIZES}
+        previous = {size: load_display_icons(path) or {} for size, path in paths.items()}
+        bundled = {size: load_display_icons(display_icons_path(
+                       package_icon_dir_fullpath, color, size)) or {}
+                   for size in DISPLAY_SIZES}
+        icons = {size: {} for size in DISPLAY_SIZES}
+        for m in metadata:
+            icon_path = m["path"].get(color)
+            if not icon_path:
+                continue
+            key = posix_icon_path(icon_path)
+            if key in icons[DISPLAY_SIZES[0]]:
+                continue
+            if icon_path not in regenerated and all(
+                    key in bundled[size] for size in DISPLAY_SIZES):
+                continue
+            if icon_path not in regenerated and all(
+                    key in previous[size] for size in DISPLAY_SIZES):
+                for size in DISPLAY_SIZES:
+                    icons[size][key] = previous[size][key]
+                continue
+            with open(os.path.join(st_pkgs_dir, icon_path), "rb") as f:
+                resized = fit_icons(f.read(), DISPLAY_SIZES)
+            for size, data in resized.items():
+                icons[size][key] = base64.b64encode(data).decode("utf-8")
+        for size, path in paths.items():
+            write_json_atomic(path, icons[size], separators=(",", ":"))
+
+# ------------
+
+def pack_outdated():
+    try:
+        return os.stat(pack_file).st_mtime_ns < os.stat(metadata_file).st_mtime_ns
+    except OSError:
+        return True
+
+# ------------
+
+def worker_count():
+    workers = setting('refresh_workers', 0)
+    if not isinstance(workers, int) or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+# ------------
+
 # def main():
-def ls_refresh_database():
+def ls_refresh_database(on_metadata_written=None, on_progress=None,
+                        release_icons=None, retry_failed=False,
+                        render_batch=None, lazy=False):
+    with perf.stage("refresh: total"):
+        return _refresh_database(on_metadata_written, on_progress,
+                                 release_icons, retry_failed, render_batch, lazy)
+
+
+def _refresh_database(on_metadata_written, on_progress, release_icons,
+                      retry_failed, render_batch, lazy):
 
     if os.path.exists(user_yaml_file):
         yaml_file = user_yaml_file
@@ -166,70 +574,218 @@ def ls_refresh_database():
     for color in COLORS:
         icon_color_dir = os.path.join(user_icon_dir_fullpath, color)
         Path(icon_color_dir).mkdir(parents=True, exist_ok=True)
-    # Path(user_log_dir).mkdir(parents=True, exist_ok=True)
+    Path(user_log_dir).mkdir(parents=True, exist_ok=True)
 
     try:
         with open(yaml_file, "r", encoding="utf-8") as f:
             data = yaml.safe_load(f)
 
-        metadata = []
-        all_symbols = [
-            (table, symbol)
-            for table in data.get("tables", [])
-            for symbol in table.get("symbols", [])
-        ]
+        all_symbols = read_symbols(data)
         total = len(all_symbols)
         new_icon = 0
-
-        for index, (table, command) in enumerate(all_symbols):
-            package = table.get("package")
-            type_ = table.get("type")
-            keywords = table.get("keywords", [])
-            if isinstance(keywords, str):
-                keywords = [keywords]
-
-            symbol_data = {
-                "command": command,
-                "package": package,
-                "type": type_,
-                "keywords": keywords,
+        regenerated = set()
+        up_to_date = 0
+
+        # Diff the YAML against the manifest of the previous refresh: only
+        # new entries and entries whose rendering inputs changed get icons
+        # rendered. Changed entries are re-rendered even if an icon exists.
+        manifest = BuildManifest.load(manifest_file, settings_hash())
+        entries = {}
+        existing = {}
+        groups = {}
+
+        # Icons that failed with the same inputs are not compiled again,
+        # unless asked to
+        failures = FailureCache.load(failures_file, settings_hash())
+        skipped = {}
+
+        # With `lazy`, missing icons are not rendered: their symbols are
+        # listed without them, and the viewer renders the ones it displays
+        deferred = set()
+        for symbol_data in all_symbols:
+            key = entry_key(symbol_data)
+            if key in entries:
+                continue
+            old = manifest.entries.get(key)
+            entry = {
+                "render": manifest.render_hash(symbol_data),
+                "keywords": manifest.keywords_hash(symbol_data),
+                "paths": {},
             }
-            if "fontenc" in table:
-                symbol_data["fontenc"] = table["fontenc"]
-
-            paths = {}
-
+            entries[key] = entry
+            if (
+                old and old["render"] == entry["render"]
+                and set(old["paths"]) == set(COLORS)
+                and user_icons_exist(old["paths"])
+                ):
+                entry["paths"] = {c: posix_icon_path(p) for c, p in old["paths"].items()}
+                continue
+
+            # Missing icons are grouped by preamble and rendered in batches.
+            # Icons of unchanged entries may have been rendered on demand.
             for color in COLORS:
-                icon_name, status = generate_icon(symbol_data, color)
-                msg = f"[{index+1}/{total}] {command.ljust(20)} ({color}) : "
-                if status == "exists":
-                    print(msg + "⏩ Already exists")
-                    paths[color] = icon_name
-                elif status == "generated":
-                    print(msg + f"✅ {icon_name}")
-                    paths[color] = icon_name
-                    new_icon += 1
-                elif status == "latex_failed":
-                    print(msg + "❌ LaTeX failed")
-                elif status == "dvipng_failed":
-                    print(msg + "❌ dvipng failed")
-                elif status == "mogrify_failed":
-                    print(msg + "❌ mogrify failed")
-
-            if paths:
+                icon_key = hash_filename(symbol_data["command"], color,
+                                         symbol_data["package"])
+                if old and old["render"] != entry["render"]:
+                    existing[icon_key] = None
+                else:
+                    existing[icon_key] = existing_icon(symbol_data, color)
+                if existing[icon_key] is None:
+                    failure = None if retry_failed else failures.get(symbol_data, color)
+                    if failure:
+                        skipped[icon_key] = failure["status"]
+                        continue
+                    if lazy:
+                        deferred.add(icon_key)
+                        continue
+                    group = (symbol_data["package"], symbol_data.get("fontenc"))
+                    groups.setdefault(group, []).append((icon_key, symbol_data, color))
+
+        # Each preamble is only loaded once, by dumping it into a format file
+        render_batch = render_batch or generate_icons_batch
+        formats = None
+        if (
+            groups and render_batch is generate_icons_batch
+            and setting('precompiled_formats', True)
+            ):
+            version = tex_version()
+            if version is not None:
+                formats = FormatCache(user_format_dir, version,
+                                      timeout=setting('render_timeout', 60))
+
+        # Batches are rendered concurrently by the TeX workers, but results
+        # are collected and reported in the YAML order
+        tex_workers.resize(worker_count())
+        jobs = {}
+        for group_jobs in groups.values():
+            for i in range(0, len(group_jobs), BATCH_SIZE):
+                batch = group_jobs[i:i + BATCH_SIZE]
+                future = tex_workers.submit(render_batch,
+                                            [(s, color) for _, s, color in batch],
+                                            formats)
+                for j, (icon_key, _, _) in enumerate(batch):
+                    jobs[icon_key] = (future, j)
+
+        try:
+            reported = set()
+            for index, symbol_data in enumerate(all_symbols):
+                command = symbol_data["command"]
+                key = entry_key(symbol_data)
+                if key in reported or entries[key]["paths"]:
+                    up_to_date += 1
+                    continue
+                reported.add(key)
+                if on_progress:
+                    on_progress(index + 1, total)
+
+                statuses = set()
+                for color in COLORS:
+                    icon_key = hash_filename(command, color, symbol_data["package"])
+                    msg = f"[{index+1}/{total}] {command.ljust(20)} ({color}) : "
+                    if existing[icon_key]:
+                        icon_name, status = existing[icon_key], "exists"
+                    elif icon_key in skipped:
+                        print(msg + f"⏭ Skipped, previously failed ({skipped[icon_key]})")
+                        statuses.add("skipped")
+                        continue
+                    elif icon_key in deferred:
+                        print(msg + "⏳ Deferred, rendered when displayed")
+                        statuses.add("deferred")
+                        continue
+                    else:
+                        future, j = jobs[icon_key]
+                        icon_name, status = future.result()[j]
+                        if status == "generated":
+                            failures.discard(symbol_data, color)
+                        else:
+                            log = log_excerpt(failure_log_path(symbol_data, color))
+                            failures.add(symbol_data, color, status, log)
+                    statuses.add(status)
+
+                    if status == "exists":
+                        entries[key]["paths"][color] = icon_name
+                    elif status == "generated":
+                        print(msg + f"✅ {icon_name}")
+                        entries[key]["paths"][color] = icon_name
+                        regenerated.add(icon_name)
+                        new_icon += 1
+                    elif status == "latex_failed":
+                        print(msg + "❌ LaTeX failed")
+                    elif status == "dvipng_failed":
+                        print(msg + "❌ dvipng failed")
+                    elif status == "mogrify_failed":
+                        print(msg + "❌ mogrify failed")
+                if statuses == {"exists"}:
+                    up_to_date += 1
+
+        finally:
+            # Do not leave the batches of a failed refresh in the queue
+            for future, _ in jobs.values():
+                future.cancel()
+
+        # Symbols with deferred icons are listed without them, unless one of
+        # their icons already failed (the other ones would fail as well)
+        metadata = []
+        for symbol_data in all_symbols:
+            paths = entries[entry_key(symbol_data)]["paths"]
+            icon_keys = [hash_filename(symbol_data["command"], color,
+                                       symbol_data["package"]) for color in COLORS]
+            if paths or (any(k in deferred for k in icon_keys)
+                         and not any(k in skipped for k in icon_keys)):
                 metadata.append({
-                    "name": command, 
-                    "package": package,
-                    "type": type_,
-                    "keywords": keywords,
+                    "name": symbol_data["command"], 
+                    "package": symbol_data["package"],
+                    "type": symbol_data["type"],
+                    "keywords": symbol_data["keywords"],
                     "path": paths,
                 })
 
-        with open(metadata_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-        print(f"\n✅ Done. {new_icon} new icons generated.\n"
-              f"Data saved to {metadata_file}.")
+        removed = remove_orphaned_icons(manifest.entries, entries)
+        manifest.entries = entries
+        manifest.save()
+        failures.save()
+
+        # Only rewrite the metadata, atlases and display icons if something
+        # actually changed
+        try:
+            with open(metadata_file, "r", encoding="utf-8") as f:
+                changed = json.load(f) != metadata
+        except (OSError, ValueError):
+            changed = True
+        if changed or new_icon or removed or not all(
+                os.path.isfile(atlas_path(user_icon_dir_fullpath, color))
+                and os.path.isfile(display_icons_path(user_icon_dir_fullpath,
+                                                      color, size))
+                for color in COLORS for size in DISPLAY_SIZES):
+            if release_icons:
+                release_icons()
+            try:
+                with perf.stage("refresh: atlases"):
+                    write_atlases(metadata)
+                    write_display_icons(metadata, regenerated)
+            except Exception as e:
+                print(f"❌ Icon atlases could not be written ({e}), "
+                      f"icons will be read one file at a time.")
+        if changed:
+            write_json_atomic(metadata_file, metadata, indent=2)
+        if changed or pack_outdated():
+            # Written after the JSON file: the viewer only reads the pack
+            # while it is at least as recent as the JSON file
+            try:
+                write_symbol_pack(pack_file, metadata, COLORS)
+            except Exception as e:
+                print(f"❌ {PACK_FILE} could not be written ({e}), "
+                      f"the symbols will be read from {METADATA_FILE}.")
+        if changed:
+            if on_metadata_written:
+                on_metadata_written()
+
+        print(f"\n✅ Done. {new_icon} new icons generated, "
+              f"{up_to_date} symbols up to date, {removed} orphaned icons removed, "
+              f"{len(skipped)} previously failed icons skipped, "
+              f"{len(deferred)} icons deferred.\n"
+              + (f"Data saved to {metadata_file}." if changed
+                 else "The symbols data did not change."))
 
     except Exception as e:
         print(f"❌ There was an error when updating the data:\n{e}\n" 
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+from .build_manifest import digest
+from .perf import perf
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def tex_version():
+    '''First line of `latex --version`, or None if latex cannot be run'''
+    try:
+        result = subprocess.run(["latex", "--version"], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return (result.stdout.splitlines() or [""])[0]
+
+
+# ------------------------------- Format cache --------------------------------
+
+class FormatCache:
+    '''Precompiled LaTeX formats, one per preamble.
+
+    The LaTeX kernel, the class and the packages of a preamble are loaded
+    once by `latex -ini` and dumped into a format file, so that documents
+    sharing that preamble only contain their body and are compiled with
+    `-fmt`. Format files are kept in `directory`, named after the TeX
+    version and the preamble; formats of other TeX versions are deleted.
+    A preamble that cannot be dumped is remembered for the session, and its
+    documents are compiled the usual way.
+    '''
+
+    def __init__(self, directory, version, timeout=None):
+        self.directory = directory
+        self.version = version
+        self.timeout = timeout
+        self.prefix = digest(version)[:8] + "-"
+        self._formats = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".fmt") and not name.startswith(self.prefix):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def get(self, preamble):
+        '''Path (without the .fmt extension) of the format of `preamble`, or
+        None if it could not be dumped'''
+        name = self.prefix + digest(preamble)
+        with self._lock:
+            if name in self._formats:
+                return self._formats[name]
+            lock = self._locks.setdefault(name, threading.Lock())
+
+        # Workers needing the same format wait for the first one to dump it
+        with lock:
+            with self._lock:
+                if name in self._formats:
+                    return self._formats[name]
+            path = self._dump(name, preamble)
+            with self._lock:
+                self._formats[name] = path
+            return path
+
+    def _dump(self, name, preamble):
+        path = os.path.join(self.directory, name)
+        if os.path.isfile(path + ".fmt"):
+            return path
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tex_path = os.path.join(tmpdir, "preamble.tex")
+            with open(tex_path, "w", encoding="utf-8") as f:
+                f.write(preamble + "\\dump\n")
+            try:
+                with perf.stage("refresh: latex -ini"):
+                    result = subprocess.run(["latex",
+                                             "-ini",
+                                             f"-jobname={name}",
+                                             "-interaction=nonstopmode",
+                                             f"-output-directory={tmpdir}",
+                                             "&latex",
+                                             tex_path
+                                             ],
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE,
+                                            text=True,
+                                            timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                return None
+            format_path = os.path.join(tmpdir, name + ".fmt")
+            if result.returncode != 0 or not os.path.isfile(format_path):
+                return None
+            shutil.move(format_path, path + ".fmt.tmp")
+            os.replace(path + ".fmt.tmp", path + ".fmt")
+        return path
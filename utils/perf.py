@@ -0,0 +1,83 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# ------------------------------- Configuration -----------------------------
+
+# Number of most recent timings kept per stage
+HISTORY = 256
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+# ------------------------------ Perf recorder --------------------------------
+
+class PerfRecorder:
+    '''Opt-in timings of the hot paths, grouped by named stage.
+
+    Every stage keeps its last HISTORY durations, from which the report
+    computes percentiles. Timing is off until `enabled` is set (by the
+    `instrumentation` setting): `stage()` then only checks the flag.
+    '''
+
+    def __init__(self, history=HISTORY):
+        self.enabled = False
+        self.history = history
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.history)
+            self._samples[name].append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def report(self, caches=()):
+        '''Text report of the p50/p95/max duration of every stage, and of the
+        hit rates of `caches`, given as (name, hits, misses)'''
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+
+        lines = [f"LaTeXSymbols timings (last {self.history} runs per stage, in ms)",
+                 f"{'stage':32} {'runs':>6} {'p50':>9} {'p95':>9} {'max':>9}"]
+        for name in sorted(samples):
+            values = samples[name]
+            lines.append(f"{name:32} {len(values):>6} "
+                         f"{percentile(values, 0.5) * 1000:>9.2f} "
+                         f"{percentile(values, 0.95) * 1000:>9.2f} "
+                         f"{values[-1] * 1000:>9.2f}")
+        if not samples:
+            lines.append("(nothing recorded yet)")
+
+        lines.append("")
+        lines.append("Cache hit rates")
+        for name, hits, misses in caches:
+            total = hits + misses
+            rate = f"{100 * hits / total:.1f}%" if total else "-"
+            lines.append(f"{name:32} {rate:>6} ({hits} hits, {misses} misses)")
+        return "\n".join(lines)
+
+
+perf = PerfRecorder()
@@ -0,0 +1,287 @@
+import struct
+import zlib
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# ------------------------------- Configuration -----------------------------
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+# -------------------------------- PNG decoding --------------------------------
+
+def read_png(data):
+    '''Decode a (non-interlaced) PNG file into (width, height, pixels), where
+    pixels is a flat list of 8-bit RGBA values'''
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+
+    pos = 8
+    idat = []
+    palette = trns = None
+    while pos < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if chunk_type == b"IHDR":
+            width, height, depth, color_type, _, _, interlace = \
+                struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b"PLTE":
+            palette = chunk
+        elif chunk_type == b"tRNS":
+            trns = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"IEND":
+            break
+
+    if interlace:
+        raise ValueError("Interlaced PNG files are not supported")
+    if color_type not in CHANNELS:
+        raise ValueError(f"Unsupported PNG color type: {color_type}")
+
+    channels = CHANNELS[color_type]
+    stride = (width * channels * depth + 7) // 8
+    bpp = max(1, channels * depth // 8)
+    raw = zlib.decompress(b"".join(idat))
+    rows = unfilter(raw, stride, bpp, height)
+
+    pixels = []
+    for row in rows:
+        samples = unpack_samples(row, width * channels, depth)
+        pixels.extend(to_rgba(samples, color_type, depth, palette, trns))
+    return width, height, pixels
+
+# ------------
+
+def unfilter(raw, stride, bpp, height):
+    rows = []
+    prev = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        filter_type = raw[start]
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        if filter_type == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+        elif filter_type == 2:
+            for i in range(stride):
+                row[i] = (row[i] + prev[i]) & 0xff
+        elif filter_type == 3:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xff
+        elif filter_type == 4:
+            for i in range(stride):
+                a = row[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                row[i] = (row[i] + pred) & 0xff
+        rows.append(row)
+        prev = row
+    return rows
+
+# ------------
+
+def unpack_samples(row, count, depth):
+    if depth == 8:
+        return list(row[:count])
+    if depth == 16:
+        return list(row[0:2 * count:2])
+    per_byte = 8 // depth
+    mask = (1 << depth) - 1
+    samples = []
+    for byte in row:
+        for k in range(per_byte):
+            samples.append((byte >> (8 - depth * (k + 1))) & mask)
+    return samples[:count]
+
+# ------------
+
+def to_rgba(samples, color_type, depth, palette, trns):
+    if color_type == 3:
+        alphas = list(trns or b"")
+        alphas += [255] * (256 - len(alphas))
+        lookup = [(palette[3 * i], palette[3 * i + 1], palette[3 * i + 2], alphas[i])
+                  for i in range(len(palette) // 3)]
+        return [v for s in samples for v in lookup[s]]
+
+    # Grayscale and truecolor samples are scaled to 8 bits
+    if depth < 8:
+        scale = 255 // ((1 << depth) - 1)
+        samples = [s * scale for s in samples]
+    if color_type == 0:
+        key = None
+        if trns:
+            key = struct.unpack(">H", trns)[0]
+            key = key * scale if depth < 8 else key >> (8 if depth == 16 else 0)
+        return [v for s in samples for v in (s, s, s, 0 if s == key else 255)]
+    if color_type == 2:
+        key = None
+        if trns:
+            key = tuple(v >> (8 if depth == 16 else 0)
+                        for v in struct.unpack(">HHH", trns))
+        pixels = []
+        for i in range(0, len(samples), 3):
+            rgb = tuple(samples[i:i + 3])
+            pixels.extend(rgb + (0 if rgb == key else 255,))
+        return pixels
+    if color_type == 4:
+        return [v for i in range(0, len(samples), 2)
+                for v in (samples[i], samples[i], samples[i], samples[i + 1])]
+    return samples
+
+
+# -------------------------------- PNG encoding --------------------------------
+
+def write_png(width, height, pixels):
+    '''Encode RGBA pixels, as gray + alpha when every pixel is gray'''
+    gray = all(pixels[i] == pixels[i + 1] == pixels[i + 2]
+               for i in range(0, len(pixels), 4))
+    if gray:
+        color_type = 4
+        samples = bytearray(v for i in range(0, len(pixels), 4)
+                            for v in (pixels[i], pixels[i + 3]))
+    else:
+        color_type = 6
+        samples = bytearray(pixels)
+
+    stride = width * CHANNELS[color_type]
+    raw = b"".join(b"\x00" + samples[y * stride:(y + 1) * stride]
+                   for y in range(height))
+
+    def chunk(chunk_type, data):
+        crc = zlib.crc32(chunk_type + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (PNG_SIGNATURE + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b""))
+
+
+# -------------------------------- Resizing -----------------------------------
+
+def fitted_size(width, height, size):
+    ratio = min(size / width, size / height)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+# ------------
+
+def filter_weights(src, dst):
+    '''Weights mapping `src` samples onto `dst` samples: area averaging
+    when shrinking, linear interpolation when enlarging'''
+    scale = src / dst
+    weights = []
+    for o in range(dst):
+        if scale >= 1:
+            start, end = o * scale, (o + 1) * scale
+            taps = [(i, min(end, i + 1) - max(start, i))
+                    for i in range(int(start), min(src, int(end) + 1))]
+        else:
+            center = (o + 0.5) * scale - 0.5
+            i = min(max(int(center), 0), src - 1)
+            frac = min(max(center - i, 0.0), 1.0)
+            taps = [(i, 1 - frac), (min(i + 1, src - 1), frac)]
+        taps = [(i, w) for i, w in taps if w > 0]
+        total = sum(w for _, w in taps)
+        weights.append([(i, w / total) for i, w in taps])
+    return weights
+
+# ------------
+
+def resample(rows, dst):
+    '''Resample every row of `rows` to `dst` samples'''
+    src = len(rows[0])
+    if src % dst == 0:
+        # Shrinking by an integer factor: plain block averages
+        k = src // dst
+        return [[sum(row[i:i + k]) / k for i in range(0, src, k)] for row in rows]
+    weights = filter_weights(src, dst)
+    return [[sum(row[i] * w for i, w in taps) for taps in weights] for row in rows]
+
+# ------------
+
+def resize_rgba(width, height, pixels, new_width, new_height):
+    # Work on premultiplied alpha so that transparent pixels do not bleed.
+    # Gray images (the usual case for icons) only need two planes.
+    gray = all(pixels[i] == pixels[i + 1] == pixels[i + 2]
+               for i in range(0, len(pixels), 4))
+    colors = 1 if gray else 3
+    alphas = pixels[3::4]
+    planes = [[v * a / 255 for v, a in zip(pixels[c::4], alphas)]
+              for c in range(colors)]
+    planes.append(alphas)
+
+    resized = []
+    for plane in planes:
+        rows = resample([plane[y * width:(y + 1) * width] for y in range(height)],
+                        new_width)
+        columns = resample(list(zip(*rows)), new_height)
+        resized.append([v for row in zip(*columns) for v in row])
+
+    out = []
+    for p in range(new_width * new_height):
+        a = resized[-1][p]
+        if a <= 0:
+            out.extend((0, 0, 0, 0))
+            continue
+        rgb = [min(255, round(resized[c][p] * 255 / a)) for c in range(colors)]
+        out.extend(rgb * 3 if gray else rgb)
+        out.append(min(255, round(a)))
+    return out
+
+# ------------
+
+def fit_icon(data, size, use_pillow=True):
+    '''Resize a PNG to fit a `size` x `size` transparent square, bottom-centered
+    (like `mogrify -resize -extent -background transparent -gravity South`)'''
+    return fit_icons(data, (size,), use_pillow)[size]
+
+# ------------
+
+def fit_icons(data, sizes, use_pillow=True):
+    '''`fit_icon` for several sizes at once, decoding the PNG only once'''
+    if use_pillow and Image is not None:
+        return {size: fit_icon_pillow(data, size) for size in sizes}
+
+    width, height, pixels = read_png(data)
+    icons = {}
+    for size in sizes:
+        new_width, new_height = fitted_size(width, height, size)
+        resized = resize_rgba(width, height, pixels, new_width, new_height)
+
+        canvas = [0] * (size * size * 4)
+        x0 = (size - new_width) // 2
+        y0 = size - new_height
+        row_length = new_width * 4
+        for y in range(new_height):
+            start = ((y0 + y) * size + x0) * 4
+            canvas[start:start + row_length] = resized[y * row_length:(y + 1) * row_length]
+        icons[size] = write_png(size, size, canvas)
+    return icons
+
+# ------------
+
+def fit_icon_pillow(data, size):
+    import io
+    image = Image.open(io.BytesIO(data)).convert("RGBA")
+    new_width, new_height = fitted_size(image.width, image.height, size)
+    image = image.resize((new_width, new_height), Image.LANCZOS)
+    canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    canvas.paste(image, ((size - new_width) // 2, size - new_height))
+    output = io.BytesIO()
+    canvas.save(output, format="PNG", optimize=True)
+    return output.getvalue()
@@ -0,0 +1,188 @@
+import heapq
+
+
+# ------------------------------- Configuration -----------------------------
+
+NGRAM = 3
+
+# Fuzzy ranking: a substring match always beats a scattered one, matches
+# at the start of a term or of a word get a bonus, and so do exact names
+SUBSTRING_SCORE = 100
+PREFIX_BONUS = 60
+BOUNDARY_BONUS = 30
+EXACT_BONUS = 200
+CHAR_SCORE = 10
+CONSECUTIVE_BONUS = 5
+NAME_WEIGHT = 1.0
+KEYWORD_WEIGHT = 0.7
+PACKAGE_WEIGHT = 0.5
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def ngrams(term, n=NGRAM):
+    '''All substrings of `term` of length 1 to n'''
+    return {term[i:i + k]
+            for k in range(1, n + 1)
+            for i in range(len(term) - k + 1)}
+
+# ------------
+
+def at_boundary(term, i):
+    return i == 0 or not term[i - 1].isalnum()
+
+# ------------
+
+def fuzzy_score(query, term):
+    '''How well `term` matches `query` (0 if the characters of `query` do not
+    appear in `term` in order)'''
+    pos = term.find(query)
+    if pos >= 0:
+        score = SUBSTRING_SCORE
+        if pos == 0 or term[:pos] == "\\":
+            score += PREFIX_BONUS
+        elif at_boundary(term, pos):
+            score += BOUNDARY_BONUS
+        # The closer the term is to the query, the better
+        return score - min(len(term) - len(query), SUBSTRING_SCORE // 2)
+
+    score = 0
+    previous = None
+    for c in query:
+        i = term.find(c, 0 if previous is None else previous + 1)
+        if i < 0:
+            return 0
+        score += CHAR_SCORE
+        if previous is not None and i == previous + 1:
+            score += CONSECUTIVE_BONUS
+        if at_boundary(term, i):
+            score += BOUNDARY_BONUS // 3
+        previous = i
+    return score
+
+
+# ------------------------------- Search index --------------------------------
+
+class SearchIndex:
+    '''Inverted index over the names, packages and keywords of the symbols.
+
+    Every distinct lowercased name, package and keyword (a "term") has a
+    posting list of symbol ordinals, and every substring of up to NGRAM
+    characters of a term points back to that term. A substring query thus
+    only looks at the few terms sharing its n-grams instead of scanning
+    every symbol. Results are the same as the original `matches()` filter,
+    in file order.
+
+    `fuzzy_search()` scores the symbols matching a query as a subsequence,
+    only looking at the terms that contain all of its characters, and
+    `top()` keeps the best of them with a bounded heap.
+    '''
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.names = []
+        self.packages = []
+        self.keywords = []
+        self.stripped_names = {}
+        self.by_package = {}
+        self.by_keyword = {}
+        self.postings = {}
+        self.grams = {}
+
+        for i, s in enumerate(symbols):
+            name = s.name_lower
+            package = s.package_lower
+            kws = s.keywords_lower
+            self.names.append(name)
+            self.packages.append(package)
+            self.keywords.append(kws)
+
+            self.stripped_names.setdefault(name.lstrip('\\'), []).append(i)
+            self.by_package.setdefault(package, []).append(i)
+            for kw in set(kws):
+                self.by_keyword.setdefault(kw, []).append(i)
+            for term in {name, package, *kws}:
+                self.postings.setdefault(term, set()).add(i)
+
+        for term in self.postings:
+            for gram in ngrams(term):
+                self.grams.setdefault(gram, set()).add(term)
+
+    def search(self, filter_text):
+        '''Ordinals of the symbols matching `filter_text`, in file order'''
+        if not filter_text:
+            return list(range(len(self.symbols)))
+
+        found = set()
+        for term in self._terms_containing(filter_text):
+            found |= self.postings[term]
+        found.update(self.stripped_names.get(filter_text.strip(), ()))
+        return sorted(found)
+
+    def matches(self, i, filter_text):
+        '''Whether symbol `i` matches `filter_text`, as in `search()`'''
+        name = self.names[i]
+        return (
+            filter_text in name
+            or filter_text.strip() == name.lstrip('\\')
+            or filter_text in self.packages[i]
+            or any(filter_text in kw for kw in self.keywords[i])
+            )
+
+    def fuzzy_search(self, query, candidates=None):
+        '''{ordinal: score} of the symbols whose name, package or one of
+        whose keywords contains the characters of `query` in order.
+        `candidates` restricts the search to some ordinals (e.g. the matches
+        of a shorter query).'''
+        if candidates is None:
+            terms = None
+            for c in set(query):
+                found = self.grams.get(c, set())
+                terms = set(found) if terms is None else terms & found
+            candidates = set()
+            for term in terms or ():
+                candidates |= self.postings[term]
+
+        term_scores = {}
+        scores = {}
+        for i in candidates:
+            best = 0
+            fields = [(self.names[i], NAME_WEIGHT), (self.packages[i], PACKAGE_WEIGHT)]
+            fields += [(kw, KEYWORD_WEIGHT) for kw in self.keywords[i]]
+            for term, weight in fields:
+                score = term_scores.get(term)
+                if score is None:
+                    score = term_scores[term] = fuzzy_score(query, term)
+                best = max(best, score * weight)
+            if best > 0:
+                if self.names[i].lstrip('\\') == query:
+                    best += EXACT_BONUS
+                scores[i] = best
+        return scores
+
+    def top(self, scores, limit):
+        '''The `limit` best ordinals of `fuzzy_search()` results (all of them
+        if `limit` is 0), best first, ties in file order'''
+        if limit < 1 or len(scores) <= limit:
+            return sorted(scores, key=lambda i: (-scores[i], i))
+        best = heapq.nsmallest(limit, ((-score, i) for i, score in scores.items()))
+        return [i for _, i in best]
+
+    def with_keyword(self, keyword):
+        return self.by_keyword.get(keyword.lower(), [])
+
+    def with_package(self, package):
+        return self.by_package.get(package.lower(), [])
+
+    def _terms_containing(self, text):
+        if len(text) <= NGRAM:
+            return self.grams.get(text, ())
+
+        terms = None
+        trigrams = {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+        for gram in sorted(trigrams, key=lambda g: len(self.grams.get(g, ()))):
+            candidates = self.grams.get(gram)
+            if not candidates:
+                return ()
+            terms = set(candidates) if terms is None else terms & candidates
+        return [t for t in terms if text in t]
@@ -0,0 +1,58 @@
+import sys
+
+
+# ------------------------------- Configuration -----------------------------
+
+COLORS = ("white", "black")
+
+
+# ---------------------------------- Symbol ---------------------------------
+
+class Symbol:
+    '''One entry of the symbols database.
+
+    Packages, types and keywords are interned, so that the thousands of
+    records share a handful of string objects, and the lowercased fields
+    the filters compare against are computed once at load time. Icon
+    paths are stored in the order of COLORS.
+    '''
+
+    __slots__ = ("name", "package", "type", "keywords", "icons",
+                 "name_lower", "package_lower", "keywords_lower")
+
+    def __init__(self, name, package, type, keywords, icons,
+                 name_lower, package_lower, keywords_lower):
+        self.name = name
+        self.package = package
+        self.type = type
+        self.keywords = keywords
+        self.icons = icons
+        self.name_lower = name_lower
+        self.package_lower = package_lower
+        self.keywords_lower = keywords_lower
+
+    @classmethod
+    def create(cls, name, package, type, keywords, icons):
+        '''Symbol with interned strings and its lowercased fields'''
+        keywords = tuple(sys.intern(kw) for kw in keywords)
+        return cls(name, sys.intern(package), sys.intern(type), keywords, icons,
+                   name.lower(), sys.intern(package.lower()),
+                   tuple(sys.intern(kw.lower()) for kw in keywords))
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Symbol from a record of symbols_data.json'''
+        keywords = data.get("keywords")
+        if not isinstance(keywords, list):
+            keywords = ()
+        paths = data.get("path") or {}
+        return cls.create(data.get("name") or "", data.get("package") or "Unknown",
+                          data.get("type") or "text",
+                          [kw for kw in keywords if isinstance(kw, str)],
+                          tuple(paths.get(color) for color in COLORS))
+
+    def icon_path(self, color):
+        return self.icons[COLORS.index(color)]
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.package!r})"
@@ -0,0 +1,140 @@
+import os
+import re
+import sys
+import struct
+from .symbol import COLORS, Symbol
+
+
+# ------------------------------- Configuration -----------------------------
+
+PACK_MAGIC = b"LSSYMB01"
+# magic, color count, string table length, keyword set count,
+# keyword id count, record count
+HEADER = struct.Struct("<8sBIIII")
+TYPES = ("text", "math", "both")
+# Missing icon directory / keyword list ("keywords: null" in the YAML)
+NONE = 0xFFFFFFFF
+ICON_NAME = re.compile(r"[0-9a-f]{16}\.png")
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def record_struct(color_count):
+    '''name, package, type, keyword set, then (directory, hash) per color'''
+    return struct.Struct("<IIBI" + "I8s" * color_count)
+
+# ------------
+
+def split_icon_path(icon_path):
+    '''Split an icon path into its directory (with the trailing separator)
+    and the 8 bytes of its hash-based file name'''
+    name = re.split(r"[\\/]", icon_path)[-1]
+    if not ICON_NAME.fullmatch(name):
+        raise ValueError(f"Unexpected icon file name: {icon_path}")
+    return icon_path[:-len(name)], bytes.fromhex(name[:16])
+
+
+# -------------------------------- Writing -----------------------------------
+
+def write_symbol_pack(path, metadata, colors):
+    '''Write the symbols metadata in a compact binary form: an interned
+    string table (colors, names, packages, keywords and icon directories),
+    a table of distinct keyword lists, then one fixed-width record per
+    symbol'''
+    strings = {}
+
+    def string_id(value):
+        return strings.setdefault(value, len(strings))
+
+    for color in colors:
+        string_id(color)
+
+    keyword_sets = {}
+    records = []
+    record = record_struct(len(colors))
+    for m in metadata:
+        # Same defaults as Symbol.from_dict, so that both files read the same
+        package = m.get("package") or "Unknown"
+        type = m.get("type") or "text"
+        if type not in TYPES:
+            raise ValueError(f"Unexpected type of {m['name']}: {type!r}")
+        if not isinstance(m.get("keywords"), list):
+            keywords = NONE
+        else:
+            keywords = tuple(string_id(k) for k in m["keywords"] if isinstance(k, str))
+            keywords = keyword_sets.setdefault(keywords, len(keyword_sets))
+        icons = []
+        for color in colors:
+            icon_path = m["path"].get(color)
+            if icon_path:
+                directory, icon_hash = split_icon_path(icon_path)
+                icons += [string_id(directory), icon_hash]
+            else:
+                icons += [NONE, bytes(8)]
+        records.append(record.pack(
+            string_id(m["name"]), string_id(package), TYPES.index(type),
+            keywords, *icons))
+
+    string_table = "\0".join(strings).encode("utf-8")
+    keyword_ids = [i for keywords in keyword_sets for i in keywords]
+    offsets = [0]
+    for keywords in keyword_sets:
+        offsets.append(offsets[-1] + len(keywords))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(PACK_MAGIC, len(colors), len(string_table),
+                            len(keyword_sets), len(keyword_ids), len(records)))
+        f.write(string_table)
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(struct.pack(f"<{len(keyword_ids)}I", *keyword_ids))
+        f.write(b"".join(records))
+    os.replace(tmp_path, path)
+
+
+# -------------------------------- Reading -----------------------------------
+
+def read_symbol_pack(path):
+    '''Read a file written by `write_symbol_pack` back into a list of
+    `Symbol` records'''
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, color_count, string_length, set_count, id_count, record_count = \
+        HEADER.unpack_from(data, 0)
+    if magic != PACK_MAGIC:
+        raise ValueError(f"Not a symbols pack: {path}")
+    pos = HEADER.size
+    strings = [sys.intern(s) for s in
+               data[pos:pos + string_length].decode("utf-8").split("\0")]
+    lowered = [sys.intern(s.lower()) for s in strings]
+    pos += string_length
+    offsets = struct.unpack_from(f"<{set_count + 1}I", data, pos)
+    pos += 4 * (set_count + 1)
+    keyword_ids = struct.unpack_from(f"<{id_count}I", data, pos)
+    pos += 4 * id_count
+
+    colors = strings[:color_count]
+    keyword_sets = [keyword_ids[offsets[k]:offsets[k + 1]] for k in range(set_count)]
+    keyword_sets = [(tuple(strings[i] for i in ids), tuple(lowered[i] for i in ids))
+                    for ids in keyword_sets]
+    # Position in the records of the icon of each of COLORS
+    slots = [colors.index(color) if color in colors else None for color in COLORS]
+    record = record_struct(color_count)
+    end = pos + record.size * record_count
+    if end != len(data):
+        raise ValueError(f"Truncated symbols pack: {path}")
+
+    symbols = []
+    for name, package, type, keywords, *icons in record.iter_unpack(data[pos:end]):
+        paths = []
+        for c in slots:
+            if c is None or icons[2 * c] == NONE:
+                paths.append(None)
+            else:
+                paths.append(strings[icons[2 * c]] + icons[2 * c + 1].hex() + ".png")
+        keywords, keywords_lower = keyword_sets[keywords] if keywords != NONE else ((), ())
+        symbols.append(Symbol(
+            strings[name], strings[package], TYPES[type], keywords, tuple(paths),
+            lowered[name], lowered[package], keywords_lower))
+    return symbols
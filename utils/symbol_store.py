@@ -0,0 +1,100 @@
+import sublime
+import os
+import json
+import struct
+import threading
+from .symbol_views import SymbolViews
+from .symbol import Symbol
+from .symbol_pack import read_symbol_pack
+from .perf import perf
+
+
+# ------------------------------- Configuration -----------------------------
+
+st_pkgs_dir = sublime.packages_path()
+PKG_NAME = "LaTeXSymbols"
+METADATA_FILE = "symbols_data.json"
+PACK_FILE = "symbols_data.bin"
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [Symbol.from_dict(data) for data in json.load(f)]
+
+
+# ------------------------------- Symbol store --------------------------------
+
+class SymbolStore:
+    '''Parsed symbol database, shared by every command of the plugin.
+
+    The metadata is read from its compact binary form when it is at least as
+    recent as the JSON file (which users may edit by hand), and from the
+    JSON file otherwise. It is parsed once and only reloaded when its mtime or size
+    changes, or when the generator reports that it has rewritten it.
+    `generation` is bumped on every reload so that derived data can tell
+    when it is stale. The display order, package and keyword lists and the
+    search index come with the loaded data (see `SymbolViews`).
+    '''
+
+    def __init__(self):
+        self.generation = 0
+        self._views = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def data_path(self):
+        user_dir = os.path.join(st_pkgs_dir, "User", PKG_NAME)
+        if not os.path.isfile(os.path.join(user_dir, METADATA_FILE)):
+            user_dir = os.path.join(st_pkgs_dir, PKG_NAME)
+        symbols_data = os.path.join(user_dir, METADATA_FILE)
+        symbols_pack = os.path.join(user_dir, PACK_FILE)
+        try:
+            if os.stat(symbols_pack).st_mtime_ns >= os.stat(symbols_data).st_mtime_ns:
+                return symbols_pack
+        except OSError:
+            pass
+        return symbols_data
+
+    def views(self):
+        data_path = self.data_path()
+        st = os.stat(data_path)
+        signature = (data_path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if signature != self._signature:
+                self._load(data_path, signature)
+            return self._views
+
+    def get(self):
+        return self.views().symbols
+
+    def index(self):
+        return self.views().index()
+
+    def reload(self):
+        '''Called by the generator once it has rewritten the metadata'''
+        with self._lock:
+            self._signature = None
+        return self.get()
+
+    def _load(self, data_path, signature):
+        with perf.stage("load symbols"):
+            self._read(data_path)
+        self._signature = signature
+        self.generation += 1
+
+    def _read(self, data_path):
+        if data_path.endswith(PACK_FILE):
+            try:
+                symbols = read_symbol_pack(data_path)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Error loading {data_path}, using the JSON file instead:", e)
+                symbols = read_json(os.path.join(os.path.dirname(data_path),
+                                                 METADATA_FILE))
+        else:
+            symbols = read_json(data_path)
+        self._views = SymbolViews(symbols)
+
+
+symbol_store = SymbolStore()
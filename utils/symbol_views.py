@@ -0,0 +1,92 @@
+import threading
+from .search_index import SearchIndex
+
+
+# ---------------------------------- Helpers --------------------------------
+
+def sort_key(package_name):
+    return (0, "") if package_name == "latex" else (1, package_name.lower())
+
+
+# ------------------------------- Symbol views --------------------------------
+
+class SymbolViews:
+    '''Views of a loaded database that do not depend on the query.
+
+    Symbols are laid out once in display order (grouped by package, "latex"
+    first, then by package name) and results are handled as lists of
+    positions ("ranks") in that layout: every package covers a range of
+    ranks, so grouping a result set needs no sort nor dict per render.
+    Ranks are sorted, or ordered by relevance with the ranks of each
+    package kept together (see `ranked()`). The sorted package and
+    keyword lists of the commands, and the search index (built on first
+    use), come with it.
+    '''
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        by_package = {}
+        for i, s in enumerate(symbols):
+            by_package.setdefault(s.package, []).append(i)
+        self.package_order = sorted(by_package, key=sort_key)
+
+        self.ordered = []
+        self.rank = [0] * len(symbols)
+        self.ranges = {}
+        for package in self.package_order:
+            start = len(self.ordered)
+            for i in by_package[package]:
+                self.rank[i] = len(self.ordered)
+                self.ordered.append(symbols[i])
+            self.ranges[package] = (start, len(self.ordered))
+
+        self.packages = sorted({s.package.strip() for s in symbols if s.package.strip()})
+        self.keywords = sorted({kw for s in symbols for kw in s.keywords})
+        self._index = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = SearchIndex(self.symbols)
+            return self._index
+
+    def ranks(self, ordinals):
+        '''Ranks of the given symbol ordinals, in display order'''
+        return sorted(self.rank[i] for i in ordinals)
+
+    def ranked(self, ordinals):
+        '''Ranks of the given symbol ordinals, best first: packages in the
+        order of their best symbol, then the symbols of each package in
+        the order given'''
+        groups = {}
+        for i in ordinals:
+            r = self.rank[i]
+            groups.setdefault(self.ordered[r].package, []).append(r)
+        return [r for ranks in groups.values() for r in ranks]
+
+    def in_package(self, ranks, package):
+        start, end = self.ranges.get(package, (0, 0))
+        lo = next((k for k, r in enumerate(ranks) if start <= r < end), len(ranks))
+        return ranks[lo:self._group_end(ranks, lo)]
+
+    def grouped(self, ranks):
+        '''[(package, symbols)] of the given ranks, in their order'''
+        groups = []
+        lo = 0
+        while lo < len(ranks):
+            hi = self._group_end(ranks, lo)
+            groups.append((self.ordered[ranks[lo]].package,
+                           [self.ordered[r] for r in ranks[lo:hi]]))
+            lo = hi
+        return groups
+
+    def _group_end(self, ranks, lo):
+        '''End of the run of ranks of the package of ranks[lo]'''
+        if lo >= len(ranks):
+            return lo
+        start, end = self.ranges[self.ordered[ranks[lo]].package]
+        hi = lo + 1
+        while hi < len(ranks) and start <= ranks[hi] < end:
+            hi += 1
+        return hi
@@ -0,0 +1,72 @@
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+# ------------------------------- Worker pool ---------------------------------
+
+class TexWorkerPool:
+    '''Long-lived rendering threads fed with jobs through a priority queue.
+
+    Jobs are `fn(*args)` calls (typically the rendering of a batch of
+    icons) whose result is delivered through the returned Future. Lower
+    priorities are served first, in submission order for equal ones, so
+    that the icons the viewer is waiting for can overtake a refresh. A job
+    that raises only fails its own Future, and a worker thread that dies
+    is replaced on the next submission. The threads outlive a refresh, so
+    that the viewer and later refreshes reuse them.
+
+    The threads, not the TeX processes, are long-lived: each job still
+    starts its own latex and dvipng runs (with a time limit each, see
+    `run_command`). Keeping one engine running and feeding it the symbols
+    over a pipe, with `dvipng --follow` on its DVI file, is not done.
+    '''
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, priority=0):
+        future = Future()
+        self._queue.put((priority, next(self._counter), future, fn, args))
+        self._start_workers()
+        return future
+
+    def resize(self, workers):
+        with self._lock:
+            extra = len(self._threads) - workers
+            self.workers = workers
+        # Surplus workers exit once they get to the end of the queue
+        for _ in range(max(0, extra)):
+            self._queue.put((float("inf"), next(self._counter), None, None, None))
+        self._start_workers()
+
+    def shutdown(self):
+        self.resize(0)
+
+    def _start_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _work(self):
+        while True:
+            _, _, future, fn, args = self._queue.get()
+            if future is None:
+                with self._lock:
+                    if threading.current_thread() in self._threads:
+                        self._threads.remove(threading.current_thread())
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)